@@ -0,0 +1,275 @@
+import itertools
+import json
+import random
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlencode, urlparse, parse_qs
+
+# Synthetic world
+CATALOG_SIZE = 500  # Distinct artists subscribers can like
+ZIPF_EXPONENT = 1.1  # Skew of artist popularity across libraries
+TRACKS_PER_USER = (20, 200)  # Range of liked songs per subscriber
+TOP_ARTISTS_PER_USER = 20
+UNLISTED_ARTIST_RATIO = 0.1  # Share of artists with no Ticketmaster attraction
+MAX_EVENTS_PER_ARTIST = 6
+
+# Page sizes the real APIs cap requests at
+SPOTIFY_MAX_LIMIT = 50
+TICKETMASTER_MAX_SIZE = 200
+
+class FakeApiServer:
+    """
+    Local stand-ins for the Ticketmaster Discovery API, the Spotify Web API and the
+    Telegram Bot API, served from one threaded HTTP server on a free local port.
+
+    Responses are generated deterministically from the seed: every subscriber's
+    library is drawn from a Zipf-distributed artist catalog, so a few artists are
+    followed by most subscribers and most artists by a few. Each request can be
+    delayed by a fixed latency, and a share of requests per service can be
+    answered with 429s the way the real service would.
+    """
+
+    def __init__(self, latency=0.0, throttle_rates=None, catalog_size=CATALOG_SIZE, zipf_exponent=ZIPF_EXPONENT,
+                 tracks_per_user=TRACKS_PER_USER, seed=0, host='127.0.0.1', port=0):
+        self.latency = latency
+        self.throttle_rates = throttle_rates or {}
+        self.catalog = [f"Artist {i:05d}" for i in range(catalog_size)]
+        self.artist_ids = {name.lower(): i for i, name in enumerate(self.catalog)}
+        self.cum_weights = list(itertools.accumulate(1 / (rank + 1) ** zipf_exponent for rank in range(catalog_size)))
+        self.tracks_per_user = tracks_per_user
+        self.seed = seed
+        self.random = random.Random(seed)
+
+        self.libraries = {}
+        self.counts = Counter()
+        self.lock = threading.Lock()
+        self.message_ids = itertools.count(1)
+
+        self.httpd = ThreadingHTTPServer((host, port), _make_handler(self))
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def environment(self):
+        """
+        Environment variables that point the notifier at this server.
+        """
+        return {
+            'TICKETMASTER_BASE_URL': f"{self.url}/ticketmaster/discovery/v2",
+            'SPOTIFY_API_URL': f"{self.url}/spotify/v1/",
+            'TELEGRAM_API_URL': f"{self.url}/telegram/bot{{0}}/{{1}}",
+        }
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def take_counts(self):
+        """
+        Returns the requests served per endpoint since the last call, and resets them.
+        """
+        with self.lock:
+            counts, self.counts = dict(self.counts), Counter()
+        return counts
+
+    def _count(self, endpoint):
+        with self.lock:
+            self.counts[endpoint] += 1
+
+    def _should_throttle(self, service):
+        rate = self.throttle_rates.get(service, 0)
+        if not rate:
+            return False
+        with self.lock:
+            return self.random.random() < rate
+
+    # Synthetic data
+
+    def library(self, access_token):
+        # (artist of each liked song, newest first; top artists), generated on first request
+        with self.lock:
+            library = self.libraries.get(access_token)
+            if library is None:
+                rng = random.Random(f"{self.seed}:{access_token}")
+                track_count = rng.randint(*self.tracks_per_user)
+                artists = rng.choices(range(len(self.catalog)), cum_weights=self.cum_weights, k=track_count)
+                top = rng.choices(range(len(self.catalog)), cum_weights=self.cum_weights, k=TOP_ARTISTS_PER_USER)
+                library = self.libraries[access_token] = (artists, list(dict.fromkeys(top)))
+        return library
+
+    def artist_events(self, artist):
+        rng = random.Random(f"{self.seed}:events:{artist}")
+        start = date(2030, 1, 1)
+        return [
+            {
+                'id': f"E{artist}-{n}",
+                'name': f"{self.catalog[artist]} Live",
+                'url': f"https://tickets.example/{artist}/{n}",
+                'dates': {'start': {'localDate': (start + timedelta(days=rng.randrange(365))).isoformat()}},
+                '_embedded': {
+                    'attractions': [{'id': f"K{artist}", 'name': self.catalog[artist]}],
+                    'venues': [{
+                        'name': f"Venue {rng.randrange(1000)}",
+                        'city': {'name': f"City {rng.randrange(200)}"},
+                        'country': {'name': 'Benchmarkland', 'countryCode': 'BM'},
+                        'location': {'latitude': f"{rng.uniform(-60, 60):.4f}", 'longitude': f"{rng.uniform(-180, 180):.4f}"},
+                    }],
+                },
+            }
+            for n in range(rng.randint(0, MAX_EVENTS_PER_ARTIST))
+        ]
+
+    def is_listed(self, artist):
+        return random.Random(f"{self.seed}:listed:{artist}").random() >= UNLISTED_ARTIST_RATIO
+
+    # Endpoints, each returning (status, headers, body)
+
+    def ticketmaster_attractions(self, query):
+        keyword = query.get('keyword', [''])[0].strip().lower()
+        artist = self.artist_ids.get(keyword)
+        attractions = []
+        if artist is not None and self.is_listed(artist):
+            attractions.append({
+                'id': f"K{artist}",
+                'name': self.catalog[artist],
+                'upcomingEvents': {'_total': len(self.artist_events(artist))},
+            })
+        body = {'page': {'size': 20, 'totalElements': len(attractions), 'totalPages': 1, 'number': 0}}
+        if attractions:
+            body['_embedded'] = {'attractions': attractions}
+        return 200, {}, body
+
+    def ticketmaster_events(self, query):
+        ids = [i for i in query.get('attractionId', [''])[0].split(',') if i.startswith('K')]
+        size = min(int(query.get('size', ['20'])[0]), TICKETMASTER_MAX_SIZE)
+        page = int(query.get('page', ['0'])[0])
+        events = sorted(
+            (event for attraction_id in ids for event in self.artist_events(int(attraction_id[1:]))),
+            key=lambda event: (event['dates']['start']['localDate'], event['id']),
+        )
+        body = {'page': {'size': size, 'totalElements': len(events), 'totalPages': -(-len(events) // size), 'number': page}}
+        page_events = events[page * size:(page + 1) * size]
+        if page_events:
+            body['_embedded'] = {'events': page_events}
+        return 200, {}, body
+
+    def spotify_saved_tracks(self, access_token, query, path):
+        artists, _ = self.library(access_token)
+        limit = min(int(query.get('limit', ['20'])[0]), SPOTIFY_MAX_LIMIT)
+        offset = int(query.get('offset', ['0'])[0])
+        newest = time.mktime((2026, 1, 1, 0, 0, 0, 0, 0, 0))
+        items = [
+            {
+                'added_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(newest - position * 3600)),
+                'track': {'name': f"Track {position}", 'artists': [{'name': self.catalog[artist]}]},
+            }
+            for position, artist in enumerate(artists[offset:offset + limit], start=offset)
+        ]
+        next_url = None
+        if offset + limit < len(artists):
+            next_url = f"{self.url}{path}?{urlencode({'limit': limit, 'offset': offset + limit})}"
+        return 200, {}, {'items': items, 'limit': limit, 'offset': offset, 'total': len(artists), 'next': next_url}
+
+    def spotify_top_artists(self, access_token, query):
+        _, top = self.library(access_token)
+        limit = min(int(query.get('limit', ['20'])[0]), SPOTIFY_MAX_LIMIT)
+        items = [{'name': self.catalog[artist]} for artist in top[:limit]]
+        return 200, {}, {'items': items, 'limit': limit, 'offset': 0, 'total': len(top), 'next': None}
+
+    def telegram_send_message(self, query):
+        chat_id = query.get('chat_id', ['0'])[0]
+        message = {
+            'message_id': next(self.message_ids),
+            'date': int(time.time()),
+            'chat': {'id': int(chat_id) if chat_id.lstrip('-').isdigit() else 0, 'type': 'private'},
+            'text': query.get('text', [''])[0],
+        }
+        return 200, {}, {'ok': True, 'result': message}
+
+    # 429 responses in each service's own format
+
+    @staticmethod
+    def throttled(service):
+        if service == 'ticketmaster':
+            # A spike arrest, as opposed to the daily quota violation
+            return 429, {'Retry-After': '1'}, {
+                'fault': {'faultstring': 'Spike arrest violation', 'detail': {'errorcode': 'policies.ratelimit.SpikeArrestViolation'}}
+            }
+        if service == 'spotify':
+            return 429, {'Retry-After': '1'}, {'error': {'status': 429, 'message': 'API rate limit exceeded'}}
+        return 429, {}, {
+            'ok': False, 'error_code': 429, 'description': 'Too Many Requests: retry after 1', 'parameters': {'retry_after': 1}
+        }
+
+    def dispatch(self, path, query, headers):
+        parts = path.strip('/').split('/')
+        service = parts[0]
+        if service == 'ticketmaster' and path.endswith('/attractions.json'):
+            endpoint, handler = 'ticketmaster.attractions', lambda: self.ticketmaster_attractions(query)
+        elif service == 'ticketmaster' and path.endswith('/events.json'):
+            endpoint, handler = 'ticketmaster.events', lambda: self.ticketmaster_events(query)
+        elif service == 'spotify' and path.endswith('/me/tracks'):
+            token = headers.get('Authorization', '').replace('Bearer ', '')
+            endpoint, handler = 'spotify.saved_tracks', lambda: self.spotify_saved_tracks(token, query, path)
+        elif service == 'spotify' and path.endswith('/me/top/artists'):
+            token = headers.get('Authorization', '').replace('Bearer ', '')
+            endpoint, handler = 'spotify.top_artists', lambda: self.spotify_top_artists(token, query)
+        elif service == 'telegram' and path.endswith('/sendMessage'):
+            endpoint, handler = 'telegram.send_message', lambda: self.telegram_send_message(query)
+        else:
+            return 404, {}, {'error': f"Unknown endpoint {path}"}
+
+        if self.latency:
+            time.sleep(self.latency)
+        if self._should_throttle(service):
+            self._count(f"{endpoint}.429")
+            return self.throttled(service)
+        self._count(endpoint)
+        return handler()
+
+
+def _make_handler(server):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # Keep-alive, like the real APIs
+        disable_nagle_algorithm = True  # Otherwise headers and body wait on delayed ACKs
+
+        def do_GET(self):
+            self._handle({})
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length).decode() if length else ''
+            self._handle(parse_qs(body) if body else {})
+
+        def _handle(self, form):
+            url = urlparse(self.path)
+            query = dict(parse_qs(url.query), **form)
+            if url.path == '/_stats':
+                status, headers, body = 200, {}, server.take_counts()
+            else:
+                status, headers, body = server.dispatch(url.path, query, self.headers)
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
@@ -0,0 +1,165 @@
+"""
+Measures a full notifier run against local stand-ins for every external API.
+
+    python -m benchmarks.run_benchmark --subscribers 10,1000,10000
+
+Each population runs in a fresh process and working directory, first cold (no
+caches or saved state) and then warm (the same stores, as on the next run).
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from benchmarks.fake_apis import FakeApiServer, CATALOG_SIZE, ZIPF_EXPONENT
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+UNLIMITED_RATE = 1e9  # Token bucket rate that never blocks
+PASSES = ('cold', 'warm')
+
+# Populate the subscriber store and run every pass; called in the child process
+def run_population(subscribers, stats_url, lift_rate_limits):
+    from notifier.subscribers import SubscriberStore
+
+    store = SubscriberStore()
+    for i in range(subscribers):
+        store.upsert(str(i + 1), f"user-{i}", 'refresh', expires_at=int(time.time()) + 30 * 86400)
+    store.close()
+
+    import logging
+    import main
+    from notifier import metrics, notification_service, spotify_client
+    from notifier.rate_limiter import TokenBucket
+    logging.getLogger().setLevel(logging.WARNING)
+
+    if lift_rate_limits:
+        # Measure the code rather than the pacing it does on purpose
+        main.get_concert_client().rate_limiter = TokenBucket(UNLIMITED_RATE)
+        main.get_notification_service().rate_limiter = TokenBucket(UNLIMITED_RATE)
+        spotify_client.rate_limiter = TokenBucket(UNLIMITED_RATE)
+        notification_service.MESSAGE_SLEEP_TIME = 0
+
+    results = []
+    for name in PASSES:
+        _fetch_stats(stats_url)  # Reset the server's request counts
+        sent_before = metrics.MESSAGES_SENT.get()
+        start = time.perf_counter()
+        main.notify_all_subscribers()
+        wall_time = time.perf_counter() - start
+        messages = metrics.MESSAGES_SENT.get() - sent_before
+        results.append({
+            'subscribers': subscribers,
+            'pass': name,
+            'wall_time': wall_time,
+            'requests': _fetch_stats(stats_url),
+            'messages': messages,
+            'messages_per_second': messages / wall_time if wall_time else 0,
+            'peak_rss_mb': _peak_rss_mb(),
+        })
+    return results
+
+def _fetch_stats(stats_url):
+    with urllib.request.urlopen(stats_url) as response:
+        return json.load(response)
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+# Run one population in a fresh process, so module state and peak memory are its own
+def benchmark_population(server, subscribers, lift_rate_limits):
+    with tempfile.TemporaryDirectory(prefix='notifier-benchmark-') as workdir:
+        env = dict(
+            os.environ,
+            **server.environment(),
+            TELEGRAM_BOT_TOKEN='123456:benchmark',
+            TICKETMASTER_API_KEY='benchmark',
+            PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get('PYTHONPATH')])),
+        )
+        command = [
+            sys.executable, '-m', 'benchmarks.run_benchmark',
+            '--child', str(subscribers), '--stats-url', f"{server.url}/_stats",
+        ]
+        if lift_rate_limits:
+            command.append('--lift-rate-limits')
+        completed = subprocess.run(command, cwd=workdir, env=env, stdout=subprocess.PIPE, check=True)
+    return json.loads(completed.stdout.decode().strip().splitlines()[-1])
+
+def print_report(results):
+    columns = ('subscribers', 'pass', 'wall s', 'TM calls', 'Spotify calls', 'Telegram calls', '429s', 'messages', 'msgs/s', 'peak RSS MB')
+    rows = []
+    for result in results:
+        requests = result['requests']
+
+        def calls(service):
+            return sum(count for endpoint, count in requests.items() if endpoint.startswith(service))
+
+        rows.append((
+            result['subscribers'],
+            result['pass'],
+            f"{result['wall_time']:.2f}",
+            calls('ticketmaster.'),
+            calls('spotify.'),
+            calls('telegram.'),
+            sum(count for endpoint, count in requests.items() if endpoint.endswith('.429')),
+            result['messages'],
+            f"{result['messages_per_second']:.1f}",
+            f"{result['peak_rss_mb']:.1f}",
+        ))
+    widths = [max(len(str(value)) for value in column) for column in zip(columns, *rows)]
+    for row in (columns, *rows):
+        print("  ".join(str(value).rjust(width) for value, width in zip(row, widths)))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark a notifier run against local fake APIs.")
+    parser.add_argument('--subscribers', default='10,1000,10000', help="Comma-separated population sizes")
+    parser.add_argument('--catalog-size', type=int, default=CATALOG_SIZE, help="Distinct artists in the synthetic catalog")
+    parser.add_argument('--zipf-exponent', type=float, default=ZIPF_EXPONENT, help="Skew of artist popularity")
+    parser.add_argument('--latency', type=float, default=0.02, help="Seconds added to every fake API response")
+    parser.add_argument('--ticketmaster-429-rate', type=float, default=0.0, help="Share of Ticketmaster requests answered with 429")
+    parser.add_argument('--spotify-429-rate', type=float, default=0.0, help="Share of Spotify requests answered with 429")
+    parser.add_argument('--telegram-429-rate', type=float, default=0.0, help="Share of Telegram requests answered with 429")
+    parser.add_argument('--lift-rate-limits', action='store_true', help="Disable the notifier's own client-side pacing")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help="Print results as JSON lines instead of a table")
+    parser.add_argument('--child', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--stats-url', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        print(json.dumps(run_population(args.child, args.stats_url, args.lift_rate_limits)))
+        return
+
+    server = FakeApiServer(
+        latency=args.latency,
+        throttle_rates={
+            'ticketmaster': args.ticketmaster_429_rate,
+            'spotify': args.spotify_429_rate,
+            'telegram': args.telegram_429_rate,
+        },
+        catalog_size=args.catalog_size,
+        zipf_exponent=args.zipf_exponent,
+        seed=args.seed,
+    ).start()
+    try:
+        results = []
+        for subscribers in (int(size) for size in args.subscribers.split(',')):
+            population_results = benchmark_population(server, subscribers, args.lift_rate_limits)
+            if args.json:
+                for result in population_results:
+                    print(json.dumps(result))
+            results.extend(population_results)
+    finally:
+        server.stop()
+
+    if not args.json:
+        print_report(results)
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,11 @@
 import telebot
-import os
-import json
 from spotipy.oauth2 import SpotifyOAuth
 from config import TELEGRAM_BOT_TOKEN, SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET, SPOTIFY_REDIRECT_URI
+from notifier.subscribers import SubscriberStore
+from notifier.locations import DEFAULT_RADIUS_KM, MAX_RADIUS_KM
 
 bot = telebot.TeleBot(TELEGRAM_BOT_TOKEN)
-subscribers_file = 'subscribers.json'
-
-# Load subscribers from file
-def load_subscribers():
-    if os.path.exists(subscribers_file):
-        with open(subscribers_file, 'r') as file:
-            return json.load(file)
-    return {}
-
-# Save subscribers to file
-def save_subscribers(subscribers):
-    with open(subscribers_file, 'w') as file:
-        json.dump(subscribers, file, indent=4)
+subscriber_store = SubscriberStore()
 
 # Spotify authentication handler
 def get_spotify_oauth(chat_id):
@@ -32,7 +20,11 @@ def get_spotify_oauth(chat_id):
 # Start command to welcome users
 @bot.message_handler(commands=['start'])
 def send_welcome(message):
-    bot.reply_to(message, "Welcome to Liked Artists Concert Notifier! Use /subscribe to link your Spotify account.")
+    bot.reply_to(
+        message,
+        "Welcome to Liked Artists Concert Notifier! Use /subscribe to link your Spotify account, "
+        "then /location to hear only about concerts near you.",
+    )
 
 # Subscribe command to initiate OAuth flow
 @bot.message_handler(commands=['subscribe'])
@@ -44,7 +36,98 @@ def subscribe(message):
     auth_url = spotify_oauth.get_authorize_url()
 
     # Send the auth link to the user
-    bot.reply_to(message, f"Please authorize the app using the following link:\n{auth_url}")
+    if subscriber_store.get(chat_id):
+        bot.reply_to(message, f"You are already subscribed. To link a different Spotify account, use the following link:\n{auth_url}")
+    else:
+        bot.reply_to(message, f"Please authorize the app using the following link:\n{auth_url}")
+
+LOCATION_HELP = (
+    "Share your location with the 📎 button to hear about concerts within "
+    f"{DEFAULT_RADIUS_KM} km, or send one of:\n"
+    "/location <latitude> <longitude> [radius km]\n"
+    "/location <country code>, e.g. /location DE\n"
+    "/location off, for concerts anywhere\n"
+    "/radius <km>, to change the distance"
+)
+
+def describe_location(location):
+    if location is None:
+        return "You hear about concerts anywhere."
+    if location['country_code']:
+        return f"You hear about concerts in {location['country_code']}."
+    return (
+        f"You hear about concerts within {location['radius_km']:g} km of "
+        f"{location['latitude']:.4f}, {location['longitude']:.4f}."
+    )
+
+def parse_radius(text):
+    radius_km = float(text)
+    if not 0 < radius_km <= MAX_RADIUS_KM:
+        raise ValueError(f"The radius must be between 1 and {MAX_RADIUS_KM} km")
+    return radius_km
+
+# Location command to limit notifications to concerts near the subscriber
+@bot.message_handler(commands=['location'])
+def set_location(message):
+    chat_id = message.chat.id
+    args = message.text.split()[1:]
+    if not subscriber_store.get(chat_id):
+        bot.reply_to(message, "Use /subscribe first to link your Spotify account.")
+        return
+    if not args:
+        bot.reply_to(message, f"{describe_location(subscriber_store.get_location(chat_id))}\n\n{LOCATION_HELP}")
+        return
+
+    try:
+        if len(args) == 1 and args[0].lower() == 'off':
+            subscriber_store.clear_location(chat_id)
+        elif len(args) == 1 and len(args[0]) == 2 and args[0].isalpha():
+            subscriber_store.set_country(chat_id, args[0])
+        elif len(args) in (2, 3):
+            latitude, longitude = float(args[0]), float(args[1])
+            if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+                raise ValueError("Latitude must be between -90 and 90, longitude between -180 and 180")
+            radius_km = parse_radius(args[2]) if len(args) == 3 else DEFAULT_RADIUS_KM
+            subscriber_store.set_location(chat_id, latitude, longitude, radius_km)
+        else:
+            bot.reply_to(message, LOCATION_HELP)
+            return
+    except ValueError as e:
+        bot.reply_to(message, f"{e}\n\n{LOCATION_HELP}")
+        return
+    bot.reply_to(message, describe_location(subscriber_store.get_location(chat_id)))
+
+# A location shared from the Telegram app keeps the subscriber's radius, if they chose one
+@bot.message_handler(content_types=['location'])
+def receive_location(message):
+    chat_id = message.chat.id
+    current = subscriber_store.get_location(chat_id)
+    radius_km = current['radius_km'] if current and current['radius_km'] else DEFAULT_RADIUS_KM
+    if not subscriber_store.set_location(chat_id, message.location.latitude, message.location.longitude, radius_km):
+        bot.reply_to(message, "Use /subscribe first to link your Spotify account.")
+        return
+    bot.reply_to(message, describe_location(subscriber_store.get_location(chat_id)))
+
+# Radius command to widen or narrow the area around the subscriber's location
+@bot.message_handler(commands=['radius'])
+def set_radius(message):
+    chat_id = message.chat.id
+    args = message.text.split()[1:]
+    try:
+        radius_km = parse_radius(args[0]) if len(args) == 1 else None
+    except ValueError as e:
+        bot.reply_to(message, str(e))
+        return
+    if radius_km is None:
+        bot.reply_to(message, f"Send /radius <km>, up to {MAX_RADIUS_KM} km.")
+    elif subscriber_store.set_radius(chat_id, radius_km):
+        bot.reply_to(message, describe_location(subscriber_store.get_location(chat_id)))
+    else:
+        bot.reply_to(message, "Set your location first, by sharing it or with /location.")
+
+if __name__ == "__main__":
+    # Polling and a webhook cannot be used at the same time
+    bot.remove_webhook()
 
-# Start polling the bot
-bot.polling()
+    # Start polling the bot
+    bot.polling()
@@ -8,4 +8,14 @@ SPOTIFY_CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET")
 SPOTIFY_REDIRECT_URI = os.getenv("SPOTIFY_REDIRECT_URI")
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
+TELEGRAM_WEBHOOK_URL = os.getenv("TELEGRAM_WEBHOOK_URL")  # Public URL of server.py's /webhook route; unset to poll with bot.py
+TELEGRAM_WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET")  # Required with TELEGRAM_WEBHOOK_URL; Telegram sends it back with every update
 TICKETMASTER_API_KEY= os.getenv("TICKETMASTER_API_KEY")
+# API endpoints, overridable to point the notifier at local stand-ins (see benchmarks/)
+TICKETMASTER_BASE_URL = os.getenv("TICKETMASTER_BASE_URL", "https://app.ticketmaster.com/discovery/v2")
+SPOTIFY_API_URL = os.getenv("SPOTIFY_API_URL", "https://api.spotify.com/v1/")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")  # telebot format, e.g. http://localhost:8081/bot{0}/{1}
+TICKETMASTER_CACHE_TTL = int(os.getenv("TICKETMASTER_CACHE_TTL", 6 * 3600))
+GEONAMES_CITIES_FILE = os.getenv("GEONAMES_CITIES_FILE", "data/cities15000.txt")
+GEONAMES_COUNTRIES_FILE = os.getenv("GEONAMES_COUNTRIES_FILE", "data/countryInfo.txt")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9100))  # 0 disables the /metrics and /healthz server
@@ -1,10 +1,155 @@
-# Import the necessary modules from geopy
+import logging
+import math
+import os
+import threading
+from geopy.adapters import RequestsAdapter
 from geopy.geocoders import Nominatim
+from config import GEONAMES_CITIES_FILE, GEONAMES_COUNTRIES_FILE
+from notifier.cache import ResponseCache
+from notifier.locations import haversine_km
+from notifier.rate_limiter import TokenBucket
+from notifier.transport import get_session, READ_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+UNKNOWN_LOCATION = {'country': 'Unknown', 'city': 'Unknown'}
+MAX_OFFLINE_DISTANCE_KM = 50  # Beyond this the nearest known city is not a useful answer
+COORDINATE_PRECISION = 3  # Cache key rounding, roughly 100 m
+GEOCODE_CACHE_TTL = 365 * 86400  # Place names for a coordinate practically never change
+NOMINATIM_REQUESTS_PER_SECOND = 1  # Nominatim usage policy
+
+class SharedSessionGeopyAdapter(RequestsAdapter):
+    """
+    geopy adapter that sends requests through the shared pooled session instead of its own.
+    """
+
+    def __init__(self, *, proxies, ssl_context):
+        super().__init__(proxies=proxies, ssl_context=ssl_context)
+        self.session.close()
+        self.session = get_session()
+
+    def __del__(self):
+        # The shared session outlives any single geocoder, so there is nothing to clean up
+        pass
+
+
+class OfflineReverseGeocoder:
+    """
+    Nearest-city lookup over a GeoNames cities dump (e.g. cities15000.txt),
+    indexed by a grid of one-degree cells so a lookup only scans nearby cells.
+    """
+
+    def __init__(self, cities_file=GEONAMES_CITIES_FILE, countries_file=GEONAMES_COUNTRIES_FILE):
+        self.country_names = self._load_country_names(countries_file)
+        self.cells = {}
+        self.size = 0
+        with open(cities_file, encoding='utf-8') as f:
+            for line in f:
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) < 9:
+                    continue
+                lat, lon = float(fields[4]), float(fields[5])
+                country = self.country_names.get(fields[8], fields[8])
+                self.cells.setdefault(self._cell(lat, lon), []).append((lat, lon, fields[1], country))
+                self.size += 1
+
+    @staticmethod
+    def _load_country_names(countries_file):
+        # countryInfo.txt maps ISO codes to country names; without it the codes are used as-is
+        country_names = {}
+        if countries_file and os.path.exists(countries_file):
+            with open(countries_file, encoding='utf-8') as f:
+                for line in f:
+                    if line.startswith('#'):
+                        continue
+                    fields = line.rstrip('\n').split('\t')
+                    if len(fields) > 4:
+                        country_names[fields[0]] = fields[4]
+        return country_names
+
+    @staticmethod
+    def _cell(lat, lon):
+        return math.floor(lat), math.floor(lon)
+
+    def nearest(self, latitude, longitude, max_distance_km=MAX_OFFLINE_DISTANCE_KM):
+        """
+        Returns {'country', 'city'} for the closest city within max_distance_km, or None.
+        """
+        cell_lat, cell_lon = self._cell(latitude, longitude)
+        # A degree of longitude shrinks towards the poles, so widen the search accordingly
+        lat_cells = math.ceil(max_distance_km / 111.0)
+        lon_cells = min(180, math.ceil(max_distance_km / (111.0 * max(math.cos(math.radians(latitude)), 0.01))))
+
+        best, best_distance = None, max_distance_km
+        for d_lat in range(-lat_cells, lat_cells + 1):
+            for d_lon in range(-lon_cells, lon_cells + 1):
+                cell = (cell_lat + d_lat, (cell_lon + d_lon + 180) % 360 - 180)
+                for lat, lon, city, country in self.cells.get(cell, ()):
+                    distance = haversine_km(latitude, longitude, lat, lon)
+                    if distance <= best_distance:
+                        best, best_distance = (city, country), distance
+        if best is None:
+            return None
+        return {'country': best[1], 'city': best[0]}
+
+
+# Shared state, created on first use
+_lock = threading.Lock()
+_offline_geocoder = None
+_offline_geocoder_loaded = False
+_geocode_cache = None
+_geolocator = None
+_nominatim_limiter = TokenBucket(NOMINATIM_REQUESTS_PER_SECOND)
+
+def _get_offline_geocoder():
+    global _offline_geocoder, _offline_geocoder_loaded
+    with _lock:
+        if not _offline_geocoder_loaded:
+            _offline_geocoder_loaded = True
+            if GEONAMES_CITIES_FILE and os.path.exists(GEONAMES_CITIES_FILE):
+                _offline_geocoder = OfflineReverseGeocoder()
+                logger.info(f"Loaded {_offline_geocoder.size} cities for offline reverse geocoding")
+            else:
+                logger.warning(f"GeoNames cities file {GEONAMES_CITIES_FILE} not found, using Nominatim only")
+        return _offline_geocoder
+
+def _get_geocode_cache():
+    global _geocode_cache
+    with _lock:
+        if _geocode_cache is None:
+            _geocode_cache = ResponseCache(filename='geocode_cache.db', ttl=GEOCODE_CACHE_TTL)
+        return _geocode_cache
+
+def _get_geolocator():
+    global _geolocator
+    with _lock:
+        if _geolocator is None:
+            _geolocator = Nominatim(
+                user_agent="geoapiExercises",
+                timeout=READ_TIMEOUT,
+                adapter_factory=SharedSessionGeopyAdapter,
+            )
+        return _geolocator
+
+def _reverse_with_nominatim(latitude, longitude):
+    # Stay within Nominatim's usage policy even when called from several threads
+    _nominatim_limiter.acquire()
+    location = _get_geolocator().reverse((latitude, longitude), language='en')
+
+    if location and location.raw.get('address'):
+        address = location.raw['address']
+        country = address.get('country', 'Unknown')
+        city = address.get('city', address.get('town', 'Unknown'))
+        return {'country': country, 'city': city}
+    return dict(UNKNOWN_LOCATION)
 
 def get_country_city_from_gps(latitude, longitude):
     """
     Get the country and city from GPS coordinates.
 
+    The local GeoNames index is tried first; otherwise the result of a Nominatim
+    lookup is cached on disk by rounded coordinates, since venues repeat often.
+
     Parameters:
     latitude (float): The latitude of the GPS coordinate.
     longitude (float): The longitude of the GPS coordinate.
@@ -13,20 +158,27 @@ def get_country_city_from_gps(latitude, longitude):
     dict: A dictionary containing the country and city.
     """
     try:
-        # Initialize the Nominatim geocoder
-        geolocator = Nominatim(user_agent="geoapiExercises")
-        
-        # Get the location details
-        location = geolocator.reverse((latitude, longitude), language='en')
-        
-        if location and location.raw.get('address'):
-            address = location.raw['address']
-            country = address.get('country', 'Unknown')
-            city = address.get('city', address.get('town', 'Unknown'))
-            return {'country': country, 'city': city}
-        else:
-            return {'country': 'Unknown', 'city': 'Unknown'}
-    
+        latitude, longitude = float(latitude), float(longitude)
+
+        offline_geocoder = _get_offline_geocoder()
+        if offline_geocoder is not None:
+            location = offline_geocoder.nearest(latitude, longitude)
+            if location:
+                return location
+
+        cache = _get_geocode_cache()
+        cache_key = cache.make_key('reverse', {
+            'lat': round(latitude, COORDINATE_PRECISION),
+            'lon': round(longitude, COORDINATE_PRECISION),
+        })
+        location, _ = cache.get(cache_key)
+        if location is not None:
+            return location
+
+        location = _reverse_with_nominatim(latitude, longitude)
+        cache.set(cache_key, location)
+        return location
+
     except Exception as e:
-        print(f"Error getting location details: {e}")
-        return {'country': 'Unknown', 'city': 'Unknown'}
+        logger.error(f"Error getting location details: {e}")
+        return dict(UNKNOWN_LOCATION)
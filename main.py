@@ -1,121 +1,606 @@
 import time
-from notifier.spotify_client import SpotifyClient
-from notifier.concert_client import ConcertClient, DailyQuotaReachedException
-from notifier.notification_service import NotificationService
+import argparse
+import html
 from notifier.storage import Storage
-from geo import get_country_city_from_gps
-import json
+from notifier.library_store import LibraryStore
+from notifier.subscribers import SubscriberStore
+from notifier.scheduler import ArtistScheduler
+from notifier.checkpoint import RunCheckpoint
+from notifier.leases import PartitionLeases, DEFAULT_PARTITIONS
+from notifier.locations import SubscriberLocations
+from notifier import metrics
+from config import METRICS_PORT
 import logging
-import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-subscribers_file = 'subscribers.json'
+# Digest settings: all new concerts for a chat are packed into as few messages as possible
+TELEGRAM_MESSAGE_LIMIT = 4096  # Telegram rejects longer messages
+DIGEST_GROUP_BY_ARTIST = True
 
-notification_service = NotificationService()
-concert_client = ConcertClient()
+# Sending
+DRAIN_TIMEOUT = 600  # Longest a run waits for its queued messages to be sent before giving up on them
+IN_FLIGHT_TIMEOUT = 60  # Further wait for messages that were already being sent when it gave up
 
-# Load subscribers from file
-def load_subscribers():
-    if os.path.exists(subscribers_file):
-        with open(subscribers_file, 'r') as file:
-            return json.load(file)
-    return {}
+# Scheduler settings
+SCHEDULER_TICK = 60  # Seconds between checks for due artists
+ARTIST_INDEX_REFRESH_INTERVAL = 3600  # How often subscribers' Spotify libraries are re-read
 
-# Notify all subscribers of concerts
-def notify_all_subscribers():
-    logger.info("Starting the notifier")
+# Library ingestion
+CONCURRENT_SUBSCRIBERS = 5  # Libraries read at once; with PAGE_FETCH_WORKERS pages each, within the connection pool
+MAX_BACKGROUND_LOOKUPS = 2  # Ticketmaster attraction lookups run alongside library reads
 
-    # Load subscribers and initialize clients
-    subscribers = load_subscribers()
-    storage = Storage()  # Initialize the storage for notified concerts
+# API clients and their libraries are loaded on first use, so runs that do not need them start fast
+_notification_service = None
+_concert_client = None
+
+def get_notification_service():
+    global _notification_service
+    if _notification_service is None:
+        from notifier.notification_service import NotificationService
+        _notification_service = NotificationService()
+    return _notification_service
+
+def get_concert_client():
+    global _concert_client
+    if _concert_client is None:
+        from notifier.concert_client import ConcertClient
+        _concert_client = ConcertClient()
+    return _concert_client
+
+# Normalize an artist name for matching across subscribers and Ticketmaster
+def normalize_artist(name):
+    return name.strip().lower()
 
-    # Loop through each subscriber
-    for chat_id, tokens in subscribers.items():
+# Build an inverted index of normalized artist -> set of chat IDs from (chat_id, tokens) pairs.
+# Libraries are read CONCURRENT_SUBSCRIBERS at a time, but added in subscriber order, so artist
+# names come out the same as from a serial read. on_new_artists, if given, is called with the
+# names of artists not seen before as each subscriber is added. A subscriber whose library cannot
+# be read is left out of the index and not checkpointed, so the next run tries it again. Libraries
+# of subscribers for whom full_resync returns True are read in full instead of incrementally.
+def build_artist_index(subscribers, token_manager=None, checkpoint=None, owns=None, on_new_artists=None,
+                       full_resync=None):
+    from notifier.spotify_client import SpotifyClient
+
+    artist_index = {}
+    artist_names = {}
+    subscriber_count = 0
+
+    # Subscribers already read by an interrupted run are taken from its checkpoint
+    completed = checkpoint.completed_subscribers() if checkpoint is not None else {}
+    if completed:
+        logger.info(f"Resuming run {checkpoint.run_id}: {len(completed)} subscribers already read")
+
+    def read_library(chat_id, tokens):
         logger.info(f"Processing subscriber with chat ID {chat_id}")
 
         # Initialize Spotify client with each subscriber's tokens
         spotify_client = SpotifyClient(
             access_token=tokens['access_token'],
-            refresh_token=tokens['refresh_token']
+            refresh_token=tokens['refresh_token'],
+            chat_id=chat_id,
+            library_store=library_store,
+            token_manager=token_manager,
         )
 
         # Fetch favorite artists for this subscriber
-        favorite_artists = spotify_client.get_favorite_artists()
-        logger.info(f"Found {len(favorite_artists)} favorite artists for chat {chat_id}")
+        resync = full_resync is not None and full_resync(chat_id)
+        return spotify_client.get_favorite_artists(full_resync=resync) or []
 
-        # Fetch concerts for each artist and notify the subscriber
-        for artist in favorite_artists:
+    def known_artists(favorite_artists):
+        # Artists known without reading the library, queued in order with those being read
+        future = Future()
+        future.set_result(favorite_artists)
+        return future
+
+    def add_finished(block):
+        # Add subscribers from the front of the queue, waiting for the first one if block is set
+        while queue and (block or queue[0][2].done()):
+            chat_id, was_read, future = queue.pop(0)
+            block = False
             try:
-                concerts = concert_client.get_concerts(artist)
-            except DailyQuotaReachedException:
-                logger.error(f"Daily API quota reached for chat {chat_id}")
-                return
+                favorite_artists = future.result()
             except Exception as e:
-                logger.error(f"Error fetching concerts for artist {artist}: {e}")
+                metrics.LIBRARY_READS_FAILED.inc()
+                logger.error(f"Could not read the Spotify library of chat {chat_id}: {e}")
                 continue
-            for concert in concerts:
-                if '_embedded' not in concert:
-                    continue
-                # Sanity check - ensure the concert is the correct artist
-                if (concert['_embedded'].get('attractions') and concert['_embedded']['attractions'][0]['name'].lower() != artist.lower()) or \
-                (concert['name'].lower() != artist.lower()):
-                    logger.debug(f"Concert {concert['name']} does not match artist {artist}")
-                    continue
+            if was_read:
+                logger.info(f"Found {len(favorite_artists)} favorite artists for chat {chat_id}")
+                if checkpoint is not None:
+                    checkpoint.complete_subscriber(chat_id, favorite_artists)
+
+            new_keys = add_to_artist_index(artist_index, artist_names, chat_id, favorite_artists)
+            if new_keys and on_new_artists is not None:
+                on_new_artists([artist_names[key] for key in new_keys])
+
+    library_store = LibraryStore()  # Saved library state, so only newly liked songs are read
+    queue = []  # (chat_id, was_read, future) in subscriber order
+    try:
+        with ThreadPoolExecutor(max_workers=CONCURRENT_SUBSCRIBERS) as executor:
+            try:
+                for chat_id, tokens in subscribers:
+                    subscriber_count += 1
+                    if chat_id in completed:
+                        queue.append((chat_id, False, known_artists(completed[chat_id])))
+                    elif owns is not None and not owns(chat_id):
+                        # Another worker reads this subscriber's library; use the state it saved
+                        state = library_store.load(chat_id)
+                        if state:
+                            queue.append((chat_id, False, known_artists(SpotifyClient.rank_artists(state))))
+                    else:
+                        queue.append((chat_id, True, executor.submit(read_library, chat_id, tokens)))
+
+                    # Keep a bounded number of subscribers queued, so the store is still streamed
+                    add_finished(block=len(queue) >= 2 * CONCURRENT_SUBSCRIBERS)
+
+                while queue:
+                    add_finished(block=True)
+            finally:
+                # After a failure, do not start reading the subscribers still queued
+                for _, _, future in queue:
+                    future.cancel()
+    finally:
+        library_store.close()
+
+    logger.info(f"Found {len(artist_index)} distinct artists across {subscriber_count} subscribers")
+    return artist_index, artist_names
+
+# Add a subscriber's artists to the index, returning the keys of artists it did not have yet
+def add_to_artist_index(artist_index, artist_names, chat_id, favorite_artists):
+    new_keys = []
+    for artist in favorite_artists:
+        key = normalize_artist(artist)
+        if not key:
+            continue
+        if key not in artist_index:
+            new_keys.append(key)
+        artist_index.setdefault(key, set()).add(chat_id)
+        artist_names.setdefault(key, artist)
+    return new_keys
+
+# Pull the fields used in notifications out of a Ticketmaster event record
+def describe_concert(concert):
+    # Get city and country from the venue
+    city = concert.city
+    country = concert.country
+    if not city or not country:
+        # Get the location from geographical coordinates
+        if concert.latitude is None or concert.longitude is None:
+            logger.warning(f"No location found for concert {concert.name}")
+            city = country = 'Unknown'
+        else:
+            from geo import get_country_city_from_gps
+            venue_location = get_country_city_from_gps(concert.latitude, concert.longitude)
+            city = venue_location['city']
+            country = venue_location['country']
+
+    return {
+        'date': concert.date,
+        'city': city,
+        'country': country,
+        'venue': concert.venue,
+        'url': concert.url,
+    }
+
+# Messages are sent as Telegram HTML, where any artist or venue name can be escaped safely
+def escape(text):
+    return html.escape(str(text))
+
+def format_tickets_link(url):
+    return f'🎟️ <a href="{escape(url)}">Get Tickets</a>'
+
+def format_artist_heading(artist):
+    return f"🎶 <b>{escape(artist)}</b>"
+
+# Format the Telegram message for a single concert
+def format_concert_message(details, artist):
+    message = (
+        f"🎤 <b>Concert Alert!</b>\n\n"
+        f"🎶 <b>Artist:</b> {escape(artist)}\n"
+        f"📅 <b>Date:</b> {escape(details['date'])}"
+    )
+
+    if details['city'] and details['country']:
+        message += f"\n🌍 <b>Location:</b> {escape(details['city'])}, {escape(details['country'])}"
+
+    if details['venue']:
+        message += f"\n🏟️ <b>Venue:</b> {escape(details['venue'])}"
+
+    if details['url']:
+        message += f"\n\n{format_tickets_link(details['url'])}"
+    return message
+
+# Format one concert as an entry in a digest message
+def format_digest_entry(details, artist=None):
+    lines = []
+    if artist:
+        lines.append(format_artist_heading(artist))
+    line = f"📅 {escape(details['date'])}"
+    if details['city'] and details['country']:
+        line += f" · {escape(details['city'])}, {escape(details['country'])}"
+    lines.append(line)
+    if details['venue']:
+        lines.append(f"🏟️ {escape(details['venue'])}")
+    if details['url']:
+        lines.append(format_tickets_link(details['url']))
+    return "\n".join(lines)
+
+# Telegram counts message length in UTF-16 code units, after markup is parsed; counting the markup
+# too only ever makes digests a little shorter than they could be
+def telegram_length(text):
+    return len(text.encode('utf-16-le')) // 2
+
+# Pack a chat's new concerts into as few messages as fit Telegram's length limit
+def build_digests(new_concerts, group_by_artist=DIGEST_GROUP_BY_ARTIST):
+    """
+    Takes a list of (artist, concert_id, details) tuples and returns a list of
+    (message, concerts) pairs, where concerts are the tuples included in that message.
+    """
+    header = f"🎤 <b>Concert Alert!</b> {len(new_concerts)} new concerts"
+    if group_by_artist:
+        new_concerts = sorted(new_concerts, key=lambda c: (normalize_artist(c[0]), c[2]['date'] or ''))
+    else:
+        new_concerts = sorted(new_concerts, key=lambda c: c[2]['date'] or '')
+
+    digests = []
+    message, included, current_artist = header, [], None
+    for artist, concert_id, details in new_concerts:
+        if group_by_artist:
+            entry = format_digest_entry(details)
+            block = entry if artist == current_artist else f"{format_artist_heading(artist)}\n{entry}"
+        else:
+            block = format_digest_entry(details, artist)
+
+        if included and telegram_length(message) + 2 + telegram_length(block) > TELEGRAM_MESSAGE_LIMIT:
+            digests.append((message, included))
+            message, included = header, []
+            if group_by_artist:
+                # Repeat the artist heading at the top of the next message
+                block = f"{format_artist_heading(artist)}\n{entry}"
+
+        message += "\n\n" + block
+        included.append((artist, concert_id, details))
+        current_artist = artist
+
+    if included:
+        digests.append((message, included))
+    return digests
+
+# Mark the concerts in a message as notified once Telegram has accepted it
+def mark_concerts_as_notified(storage, chat_id, concerts):
+    with storage.batch():
+        for artist, concert_id, details in concerts:
+            storage.mark_concert_as_notified(chat_id, concert_id, details['date'])
+    logger.info(f"{len(concerts)} concerts have been notified to chat {chat_id}")
+
+# Send each chat its new concerts, as a single alert or as digests, waiting at most timeout seconds for delivery
+def send_new_concerts(new_concerts_by_chat, storage, claim_owner=None, timeout=DRAIN_TIMEOUT):
+    if not new_concerts_by_chat:
+        return
+    notification_service = get_notification_service()
+
+    for chat_id, new_concerts in new_concerts_by_chat.items():
+        if claim_owner is not None:
+            # Workers can overlap, e.g. while a lease moves; only send what no other worker has claimed
+            claimed = set(storage.claim_concerts(chat_id, [c[1] for c in new_concerts], claim_owner))
+            new_concerts = [c for c in new_concerts if str(c[1]) in claimed]
+            if not new_concerts:
+                continue
+
+        if len(new_concerts) == 1:
+            artist, concert_id, details = new_concerts[0]
+            messages = [(format_concert_message(details, artist), new_concerts)]
+        else:
+            messages = build_digests(new_concerts)
+
+        for message, concerts in messages:
+            notification_service.send_notification(
+                message, chat_id, on_sent=partial(mark_concerts_as_notified, storage, chat_id, concerts)
+            )
 
-                concert_id = concert['id']
+    # Concerts are only marked once their message is accepted, so wait for delivery before closing the store
+    if not notification_service.wait_until_sent(timeout):
+        # Unsent concerts stay unmarked, so the next run finds them again
+        discarded = notification_service.discard_pending()
+        logger.error(f"Messages still unsent after {timeout} seconds; discarded {discarded} to send next run")
+        if not notification_service.wait_until_sent(IN_FLIGHT_TIMEOUT):
+            logger.error("Messages being sent did not finish; they may be sent again next run")
+
+# Build the artist index from every subscriber's Spotify library
+def load_artist_index(checkpoint=None, owns=None, on_new_artists=None, full_resync=None):
+    from notifier.token_manager import TokenManager
+
+    subscriber_store = SubscriberStore()
+    try:
+        # Refresh every token that is about to expire up front, in one batch
+        token_manager = TokenManager(subscriber_store)
+        token_manager.refresh_expiring(owns)
+
+        # Collect every subscriber's favorite artists into one index, streaming subscribers from the store
+        with metrics.STAGE_DURATION.time(stage='index'):
+            return build_artist_index(
+                subscriber_store.iter_subscribers(), token_manager, checkpoint, owns, on_new_artists, full_resync
+            )
+    finally:
+        subscriber_store.close()
+
+# Notify all subscribers of concerts, resuming an interrupted run where it stopped.
+# Returns the number of artists followed and how many of them are left for the next run.
+def notify_all_subscribers(full_resync=None):
+    logger.info("Starting the notifier")
+    checkpoint = RunCheckpoint('full')
+    try:
+        # Phase 1: collect every subscriber's favorite artists into one index. Artists go on to
+        # Ticketmaster as each library is read: their attraction IDs are resolved in the background,
+        # so phase 2 finds them cached. Events are fetched once all followers are known.
+        lookups = ThreadPoolExecutor(max_workers=MAX_BACKGROUND_LOOKUPS)
+
+        def resolve_attractions(artists):
+            concert_client = get_concert_client()
+            for artist in artists:
+                lookups.submit(concert_client.resolve_attraction_id, artist)
+
+        try:
+            artist_index, artist_names = load_artist_index(
+                checkpoint, on_new_artists=resolve_attractions, full_resync=full_resync
+            )
+        except BaseException:
+            lookups.shutdown(cancel_futures=True)
+            raise
+        lookups.shutdown()
+
+        # Phases 2 and 3: fetch every artist and notify
+        notify_artists(artist_index, artist_names, checkpoint=checkpoint)
+
+        # Artists are only checkpointed once their events were read (or served from the cache), so those
+        # skipped because the quota ran out or a request failed are picked up by the next run
+        remaining = len(artist_index.keys() - checkpoint.completed_artists())
+        if remaining:
+            logger.warning(f"Run {checkpoint.run_id} stopped with {remaining} artists left; the next run resumes it")
+        else:
+            checkpoint.finish()
+            metrics.record_successful_run()
+        return len(artist_index), remaining
+    finally:
+        checkpoint.close()
+
+# Run the notifier once and exit, for cron jobs and systemd timers
+def run_once(full_resync=None):
+    started_at = time.monotonic()
+    try:
+        artists, remaining = notify_all_subscribers(full_resync)
+    finally:
+        # Sender threads are daemons and die with the process; sending waits at most DRAIN_TIMEOUT,
+        # so anything left here is a message that was still being sent
+        if _notification_service is not None and _notification_service.queue_depth():
+            logger.error(f"Exiting with {_notification_service.queue_depth()} messages still unsent")
+
+    summary = {
+        'duration_s': round(time.monotonic() - started_at, 1),
+        'artists': artists,
+        'artists_left': remaining,
+        'events_fetched': metrics.EVENTS_FETCHED.get(),
+        'already_notified': metrics.EVENTS_DEDUPLICATED.get(),
+        'messages_sent': metrics.MESSAGES_SENT.get(),
+        'messages_dropped': metrics.MESSAGES_FAILED.get(reason='dropped'),
+        'spotify_calls': metrics.API_REQUESTS.total(service='spotify'),
+        'ticketmaster_calls': _concert_client.requests_made if _concert_client is not None else 0,
+    }
+    logger.info("Run summary: " + ", ".join(f"{name}={value}" for name, value in summary.items()))
+    return summary
+
+# Load the home locations subscribers have set
+def load_subscriber_locations():
+    subscriber_store = SubscriberStore()
+    try:
+        return SubscriberLocations(subscriber_store.locations())
+    finally:
+        subscriber_store.close()
+
+# Fetch the given artists (all by default) and notify every chat that follows them of new concerts
+def notify_artists(artist_index, artist_names, artist_keys=None, scheduler=None, checkpoint=None, claim_owner=None):
+    storage = Storage()  # Initialize the storage for notified concerts
+    locations = load_subscriber_locations()
+
+    # Keep the store bounded by dropping concerts that have already happened, or that have no date and are old
+    expired = storage.expire_notified_concerts()
+    if expired:
+        logger.info(f"Expired {expired} notified concerts that have passed or are too old to keep")
+
+    # Phase 2: fetch each distinct artist once and fan events out to every interested chat
+    try:
+        with metrics.STAGE_DURATION.time(stage='fetch'):
+            new_concerts_by_chat = collect_new_concerts(
+                artist_index, artist_names, storage, artist_keys, scheduler, checkpoint, locations
+            )
+
+        # Phase 3: send every chat its new concerts in as few messages as possible
+        with metrics.STAGE_DURATION.time(stage='send'):
+            send_new_concerts(new_concerts_by_chat, storage, claim_owner)
+    finally:
+        storage.close()
+        if _concert_client is not None:
+            logger.info(f"Ticketmaster cache stats: {_concert_client.cache.stats()}")
+
+# Fetch each artist once and collect the concerts every following chat has not been notified of yet.
+# With subscriber locations, each artist is searched only where its followers are, and each
+# concert goes only to the followers it is local to.
+def collect_new_concerts(artist_index, artist_names, storage, artist_keys=None, scheduler=None, checkpoint=None,
+                         locations=None):
+    new_concerts_by_chat = {}
+    completed = set()
+
+    # Start from what an interrupted run fetched but did not get to send
+    if checkpoint is not None:
+        completed = checkpoint.completed_artists()
+        for chat_id, concerts in checkpoint.pending_concerts().items():
+            unsent = [c for c in concerts if not storage.is_concert_notified(chat_id, c[1])]
+            if unsent:
+                new_concerts_by_chat[chat_id] = unsent
+        if completed:
+            logger.info(f"Resuming run {checkpoint.run_id}: {len(completed)} artists already fetched")
+
+    # Lookups run concurrently; each batch of artists' events is handled as soon as it arrives
+    if artist_keys is None:
+        artist_keys = artist_index.keys()
+    keys_by_name = {
+        artist_names[key]: key for key in artist_keys if key in artist_index and key not in completed
+    }
+    regions = {}
+    if locations:
+        regions = {artist: locations.region(artist_index[key]) for artist, key in keys_by_name.items()}
+        logger.info(f"Searching {sum(1 for r in regions.values() if r)} of {len(regions)} artists by region")
+    concerts_by_artist = get_concert_client().iter_concerts(keys_by_name, regions) if keys_by_name else ()
+    for artist, concerts in concerts_by_artist:
+        key = keys_by_name[artist]
+        chat_ids = artist_index[key]
+        metrics.EVENTS_FETCHED.inc(len(concerts))
+
+        # Let the scheduler decide when to look at this artist again
+        if scheduler is not None:
+            scheduler.record_result(key, [concert.id for concert in concerts])
+
+        # Events are looked up by the artist's attraction ID, so they need no name filtering
+        artist_new_concerts = []
+        for concert in concerts:
+            concert_id = concert.id
+            details = None
+
+            audience = locations.audience(chat_ids, concert) if locations else chat_ids
+            metrics.EVENTS_OUT_OF_AREA.inc(len(chat_ids) - len(audience))
+            for chat_id in audience:
+                metrics.EVENTS_MATCHED.inc()
 
                 # Check if the concert has already been notified
                 if storage.is_concert_notified(chat_id, concert_id):
-                    logger.debug(f"Concert {concert['name']} has already been notified to chat {chat_id}")
+                    metrics.EVENTS_DEDUPLICATED.inc()
+                    logger.debug(f"Concert {concert.name} has already been notified to chat {chat_id}")
                     continue  # Skip this concert if already notified
 
-                # Get city and country from the venue
-                venue = concert['_embedded'].get('venues', [{}])[0]
-                city = venue.get('city', {}).get('name')
-                country = venue.get('country', {}).get('name')
-                if not city or not country:
-                    # Get the location from geographical coordinates
-                    lat = venue.get('location', {}).get('latitude')
-                    lon = venue.get('location', {}).get('longitude')
-                    if not lat or not lon:
-                        logger.warning(f"No location found for concert {concert['name']}")
-                        city = country = 'Unknown'
-                    else:
-                        venue_location = get_country_city_from_gps(lat, lon)
-                        city = venue_location['city']
-                        country = venue_location['country']
-                
-                venue_name = venue.get('name', '')
+                # Describe the concert once, only when someone needs it
+                if details is None:
+                    details = describe_concert(concert)
 
-                # Send notification for new concerts
-                message = (
-                    f"🎤 *Concert Alert!*\n\n"
-                    f"🎶 *Artist:* {artist}\n"
-                    f"📅 *Date:* {concert['dates']['start']['localDate']}"
-                )
+                new_concerts_by_chat.setdefault(chat_id, []).append((artist, concert_id, details))
+                artist_new_concerts.append((chat_id, artist, concert_id, details))
 
-                if city and country:
-                    message += f"\n🌍 *Location:* {city}, {country}"
+        if checkpoint is not None:
+            checkpoint.complete_artist(key, artist_new_concerts)
 
-                if venue_name:
-                    message += f"\n🏟️ *Venue:* {venue_name}"
+    return new_concerts_by_chat
 
-                if 'url' in concert:
-                    message += f"\n\n🎟️ [Get Tickets]({concert['url']})"
-                notification_service.send_notification(message, chat_id)
+# Poll artists continuously as they fall due, spreading the daily quota over the day.
+# With leases, this process is one of several workers, each handling the partitions it holds.
+# full_resync applies to the first read of the subscribers' libraries only.
+def run_scheduler(leases=None, metrics_port=METRICS_PORT, full_resync=None):
+    from notifier.concert_client import DAILY_API_QUOTA, ATTRACTIONS_PER_REQUEST
 
-                # Mark the concert as notified
-                storage.mark_concert_as_notified(chat_id, concert_id)
-                logger.info(f"Concert {concert['name']} has been notified to chat {chat_id}")
+    concert_client = get_concert_client()
+    owns = leases.owns if leases is not None else None
+    worker_id = leases.worker_id if leases is not None else None
+    scheduler = ArtistScheduler(
+        daily_budget=DAILY_API_QUOTA, artists_per_request=ATTRACTIONS_PER_REQUEST, owns=owns
+    )
+    artist_index, artist_names, indexed_at = {}, {}, 0
+    owned_partitions = None
 
-if __name__ == "__main__":
-    while True:
+    # Prometheus metrics and a health check, served alongside the loop
+    if metrics_port:
         try:
-            notify_all_subscribers()
-            logger.info("Sleeping for 1 hour...")
-            time.sleep(3600)  # Sleep for 1 hour (3600 seconds)
-        except Exception as e:
-            logger.fatal(f"Error occurred: {e}")
-            time.sleep(60)  # In case of an error, wait 1 minute before retrying
+            metrics.start_metrics_server(metrics_port)
+        except OSError as e:
+            logger.warning(f"Could not serve metrics on port {metrics_port}: {e}")
+
+    # A tick can outlast the lease TTL while libraries are read or messages sent, so keep the leases alive meanwhile
+    if leases is not None:
+        leases.start_renewing()
+
+    try:
+        while True:
+            try:
+                if leases is not None:
+                    owned_partitions, previous_partitions = leases.refresh(), owned_partitions
+                    # Each worker gets the share of the daily budget matching the share of artists it polls
+                    scheduler.daily_budget = DAILY_API_QUOTA * len(owned_partitions) / leases.partitions
+                    if owned_partitions != previous_partitions:
+                        # Newly held subscribers need their libraries read, and their artists scheduled
+                        logger.info(f"Worker {worker_id} holds partitions {sorted(owned_partitions)}")
+                        indexed_at = 0
+
+                # Re-read subscribers' libraries periodically; artists are polled on their own schedule
+                if time.time() - indexed_at >= ARTIST_INDEX_REFRESH_INTERVAL:
+                    # A scan interrupted by a restart continues with the subscribers it had not read yet
+                    index_checkpoint = RunCheckpoint(checkpoint_kind('index', worker_id))
+                    try:
+                        artist_index, artist_names = load_artist_index(index_checkpoint, owns, full_resync=full_resync)
+                        index_checkpoint.finish()
+                        full_resync = None
+                    finally:
+                        index_checkpoint.close()
+                    scheduler.sync(artist_index)
+                    indexed_at = time.time()
+
+                # Concerts a crashed poll fetched but did not send are sent even when nothing is due
+                poll_checkpoint = RunCheckpoint(checkpoint_kind('poll', worker_id))
+                try:
+                    due_artists = scheduler.next_due()
+                    if due_artists or poll_checkpoint.resumed:
+                        logger.info(f"Polling {len(due_artists)} due artists")
+                        requests_before = concert_client.requests_made
+                        notify_artists(artist_index, artist_names, due_artists, scheduler, poll_checkpoint, worker_id)
+                        scheduler.spend(concert_client.requests_made - requests_before)
+                    # Only fetched artists are rescheduled; those whose lookup failed or hit the quota stay due,
+                    # so the poll is done either way
+                    poll_checkpoint.finish()
+                finally:
+                    poll_checkpoint.close()
+                metrics.record_successful_run()
+            except Exception as e:
+                logger.fatal(f"Error occurred: {e}")
+
+            time.sleep(SCHEDULER_TICK)
+    finally:
+        if leases is not None:
+            # Let the other workers take over right away
+            leases.release()
+            leases.close()
+
+# Checkpoints are per worker, so a restarted worker resumes its own run
+def checkpoint_kind(kind, worker_id=None):
+    return f"{kind}:{worker_id}" if worker_id else kind
+
+# Which subscribers --full-resync applies to: those given, or all of them when none are
+def full_resync_filter(chat_ids):
+    if chat_ids is None:
+        return None
+    chat_ids = {str(chat_id) for chat_id in chat_ids}
+    return lambda chat_id: not chat_ids or str(chat_id) in chat_ids
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Notify subscribers of concerts by the artists they listen to.")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--once', action='store_true',
+                      help="Notify every subscriber once, wait for messages to be sent, and exit")
+    mode.add_argument('--worker', action='store_true',
+                      help="Run as one of several worker processes that share subscribers and artists by partition")
+    parser.add_argument('--worker-id', help="Stable worker name, so a restarted worker resumes its checkpoints")
+    parser.add_argument('--partitions', type=int, default=DEFAULT_PARTITIONS,
+                        help="Number of partitions workers divide between them; the same for every worker")
+    parser.add_argument('--metrics-port', type=int, default=METRICS_PORT,
+                        help="Port for /metrics and /healthz, 0 to disable; give each local worker its own")
+    parser.add_argument('--full-resync', nargs='*', metavar='CHAT_ID',
+                        help="Re-read the whole Spotify library of the given subscribers, or of every subscriber "
+                             "if none are given, instead of only the songs liked since the last run")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    full_resync = full_resync_filter(args.full_resync)
+    if args.once:
+        run_once(full_resync)
+    else:
+        leases = PartitionLeases(args.worker_id, args.partitions) if args.worker else None
+        run_scheduler(leases, args.metrics_port, full_resync)
@@ -0,0 +1,138 @@
+import json
+import sqlite3
+import threading
+import time
+
+# Defaults for the Ticketmaster response cache
+DEFAULT_TTL = 6 * 3600  # Tour listings rarely change more than a few times a month
+DEFAULT_MAX_ENTRIES = 20000
+TOUCH_GRANULARITY = 600  # Seconds within which a repeated hit need not update an entry's last access
+MAX_PENDING_TOUCHES = 500  # Buffered last-access updates written in one transaction
+
+class ResponseCache:
+    """
+    Disk-backed cache of API responses keyed by endpoint and query parameters.
+
+    Entries older than the TTL are reported as stale rather than dropped, so
+    callers can still fall back to them when a refresh is not possible (for
+    example once the daily quota has been used up). The number of entries is
+    bounded by evicting the least recently used ones. Hits only record their
+    access time in memory; it is written out in batches, so the warm path does
+    not commit once per lookup.
+    """
+
+    def __init__(self, filename='ticketmaster_cache.db', ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.filename = filename
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # Shared by the concurrent fetch workers, so all access goes through the lock
+        self.conn = sqlite3.connect(self.filename, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")  # Shared by worker processes
+        self.lock = threading.RLock()
+        self._ensure_schema()
+
+        # Counters for tuning the TTL against the daily quota
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+        # cache_key -> last access time not yet written
+        self.pending_touches = {}
+
+    def _ensure_schema(self):
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                cache_key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                stored_at REAL NOT NULL,
+                last_accessed REAL NOT NULL
+            )
+            """
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_responses_last_accessed ON responses (last_accessed)"
+        )
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(endpoint, params):
+        """
+        Builds a stable cache key from the endpoint and its query parameters.
+        The API key is left out so rotating it does not invalidate the cache.
+        """
+        key_params = {k: v for k, v in params.items() if k != 'apikey'}
+        return f"{endpoint}?{json.dumps(key_params, sort_keys=True)}"
+
+    def get(self, key):
+        """
+        Returns a (value, is_fresh) tuple, or (None, False) if the key is not cached.
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value, stored_at, last_accessed FROM responses WHERE cache_key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None, False
+
+            value, stored_at, last_accessed = row
+            now = time.time()
+            if now - last_accessed >= TOUCH_GRANULARITY:
+                self.pending_touches[key] = now
+                if len(self.pending_touches) >= MAX_PENDING_TOUCHES:
+                    self._flush_touches()
+                    self.conn.commit()
+
+            is_fresh = now - stored_at < self.ttl
+            if is_fresh:
+                self.hits += 1
+            else:
+                self.stale_hits += 1
+        return json.loads(value), is_fresh
+
+    def set(self, key, value):
+        value = json.dumps(value)
+        with self.lock:
+            now = time.time()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (cache_key, value, stored_at, last_accessed) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            self.pending_touches.pop(key, None)
+            self._flush_touches()
+            self._evict()
+            self.conn.commit()
+
+    # Write buffered access times; the caller holds the lock and commits
+    def _flush_touches(self):
+        if self.pending_touches:
+            self.conn.executemany(
+                "UPDATE responses SET last_accessed = MAX(last_accessed, ?) WHERE cache_key = ?",
+                [(accessed, key) for key, accessed in self.pending_touches.items()],
+            )
+            self.pending_touches = {}
+
+    # Drop the least recently used entries beyond the size bound
+    def _evict(self):
+        (count,) = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            self.conn.execute(
+                "DELETE FROM responses WHERE cache_key IN "
+                "(SELECT cache_key FROM responses ORDER BY last_accessed ASC LIMIT ?)",
+                (excess,),
+            )
+
+    def stats(self):
+        with self.lock:
+            # Called at the end of a run, so it is a convenient point to persist access times
+            self._flush_touches()
+            self.conn.commit()
+            return {'hits': self.hits, 'stale_hits': self.stale_hits, 'misses': self.misses}
+
+    def close(self):
+        with self.lock:
+            self._flush_touches()
+            self.conn.commit()
+            self.conn.close()
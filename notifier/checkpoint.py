@@ -0,0 +1,144 @@
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
+CHECKPOINT_MAX_AGE = 6 * 3600  # Older unfinished runs are abandoned rather than resumed, so their data cannot go stale
+
+class RunCheckpoint:
+    """
+    Progress of one notifier run, saved after every unit of work so a restarted
+    process resumes where the last one stopped instead of starting over.
+
+    A run records the subscribers whose Spotify libraries have been read (with
+    the artists found), the artists whose events have been fetched, and the new
+    concerts found for them that have not been notified yet. Opening a
+    checkpoint resumes the unfinished run of the same kind, if there is a recent
+    one, and finish() discards the run once everything has been sent.
+    """
+
+    def __init__(self, kind='full', filename='run_checkpoint.db', max_age=CHECKPOINT_MAX_AGE):
+        self.kind = kind
+        self.filename = filename
+        self.conn = sqlite3.connect(self.filename, timeout=30, check_same_thread=False)
+        self.lock = threading.RLock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self._ensure_schema()
+        self.run_id, self.resumed = self._resume_or_start(max_age)
+
+    def _ensure_schema(self):
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                started_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS run_subscribers (
+                run_id TEXT NOT NULL,
+                chat_id TEXT NOT NULL,
+                artists TEXT NOT NULL,
+                PRIMARY KEY (run_id, chat_id)
+            );
+            CREATE TABLE IF NOT EXISTS run_artists (
+                run_id TEXT NOT NULL,
+                artist_key TEXT NOT NULL,
+                PRIMARY KEY (run_id, artist_key)
+            );
+            CREATE TABLE IF NOT EXISTS run_pending (
+                run_id TEXT NOT NULL,
+                chat_id TEXT NOT NULL,
+                concert_id TEXT NOT NULL,
+                artist TEXT NOT NULL,
+                details TEXT NOT NULL,
+                PRIMARY KEY (run_id, chat_id, concert_id)
+            );
+            """
+        )
+        self.conn.commit()
+
+    def _resume_or_start(self, max_age):
+        now = time.time()
+        with self.lock:
+            # Drop abandoned runs of every kind, including those of workers that never came back
+            stale = self.conn.execute("SELECT run_id FROM runs WHERE started_at < ?", (now - max_age,)).fetchall()
+            for (run_id,) in stale:
+                self._delete_run(run_id)
+            row = self.conn.execute(
+                "SELECT run_id FROM runs WHERE kind = ? ORDER BY started_at DESC LIMIT 1", (self.kind,)
+            ).fetchone()
+            if row is not None:
+                self.conn.commit()
+                return row[0], True
+            run_id = uuid.uuid4().hex
+            self.conn.execute("INSERT INTO runs (run_id, kind, started_at) VALUES (?, ?, ?)", (run_id, self.kind, now))
+            self.conn.commit()
+        return run_id, False
+
+    def _delete_run(self, run_id):
+        # Caller must hold the lock and commit
+        for table in ('run_subscribers', 'run_artists', 'run_pending', 'runs'):
+            self.conn.execute(f"DELETE FROM {table} WHERE run_id = ?", (run_id,))
+
+    # Subscribers whose libraries were read in this run, as chat ID -> artist names
+    def completed_subscribers(self):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT chat_id, artists FROM run_subscribers WHERE run_id = ?", (self.run_id,)
+            ).fetchall()
+        return {chat_id: json.loads(artists) for chat_id, artists in rows}
+
+    def complete_subscriber(self, chat_id, artists):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO run_subscribers (run_id, chat_id, artists) VALUES (?, ?, ?)",
+                (self.run_id, str(chat_id), json.dumps(list(artists))),
+            )
+            self.conn.commit()
+
+    def completed_artists(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT artist_key FROM run_artists WHERE run_id = ?", (self.run_id,)).fetchall()
+        return {key for (key,) in rows}
+
+    def complete_artist(self, artist_key, new_concerts):
+        """
+        Records an artist as fetched together with its new (chat_id, artist, concert_id, details)
+        tuples, in one transaction, so a restart never loses or repeats part of an artist.
+        """
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO run_pending (run_id, chat_id, concert_id, artist, details) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (self.run_id, str(chat_id), str(concert_id), artist, json.dumps(details))
+                    for chat_id, artist, concert_id, details in new_concerts
+                ],
+            )
+            self.conn.execute(
+                "INSERT OR IGNORE INTO run_artists (run_id, artist_key) VALUES (?, ?)", (self.run_id, artist_key)
+            )
+            self.conn.commit()
+
+    # New concerts found earlier in this run, as chat ID -> list of (artist, concert_id, details)
+    def pending_concerts(self):
+        pending = {}
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT chat_id, artist, concert_id, details FROM run_pending WHERE run_id = ?", (self.run_id,)
+            ).fetchall()
+        for chat_id, artist, concert_id, details in rows:
+            pending.setdefault(chat_id, []).append((artist, concert_id, json.loads(details)))
+        return pending
+
+    def finish(self):
+        """
+        Discards the run once all of its work is done; the next checkpoint starts a new one.
+        """
+        with self.lock:
+            self._delete_run(self.run_id)
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
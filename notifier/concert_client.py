@@ -1,110 +1,349 @@
-import requests
-import time
 import logging
-from config import TICKETMASTER_API_KEY
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from config import TICKETMASTER_API_KEY, TICKETMASTER_BASE_URL, TICKETMASTER_CACHE_TTL
+from notifier.cache import ResponseCache
+from notifier.events import Event
+from notifier.rate_limiter import TokenBucket
+from notifier.quota import QuotaLedger
+from notifier.transport import get_session
+from notifier import metrics
 
 # Constants for rate limiting and API quota
 REQUEST_LIMIT_PER_SECOND = 5
 DAILY_API_QUOTA = 5000
+MAX_CONCURRENT_REQUESTS = 5  # Requests kept in flight by iter_concerts
+MAX_THROTTLE_RETRIES = 4  # Retries of a request rejected by per-second throttling
+THROTTLE_BACKOFF = 1  # Seconds to back off after the first throttled request, doubled each retry
+
+# Constants for attraction-based event queries
+ATTRACTION_CACHE_TTL = 30 * 86400  # An artist's attraction ID practically never changes
+ATTRACTIONS_PER_REQUEST = 20  # Attraction IDs packed into one events query
+EVENTS_PAGE_SIZE = 200  # Largest page the Discovery API returns
+MAX_EVENTS_DEPTH = 1000  # The Discovery API rejects page * size beyond this
 
 class DailyQuotaReachedException(Exception):
     pass
 
 
+class EventsDepthExceeded(Exception):
+    """
+    Raised when a query matches more events than MAX_EVENTS_DEPTH, the deepest the API pages.
+    """
+
+
+class RateLimitedException(Exception):
+    """
+    Raised when Ticketmaster answers 429. quota_exhausted tells the daily quota
+    apart from transient per-second throttling.
+    """
+
+    def __init__(self, message, retry_after=None, quota_exhausted=False, reset_at=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.quota_exhausted = quota_exhausted
+        self.reset_at = reset_at
+
+
 class ConcertClient:
-    def __init__(self):
+    def __init__(self, cache=None, attraction_cache=None, quota=None, session=None, max_workers=MAX_CONCURRENT_REQUESTS):
         self.api_key = TICKETMASTER_API_KEY
-        self.base_url = "https://app.ticketmaster.com/discovery/v2"
+        self.base_url = TICKETMASTER_BASE_URL
         self.logger = logging.getLogger(__name__)
 
-        # Track API calls for rate limiting
-        self.requests_made_in_second = 0
-        self.last_request_time = time.time()
+        # Pooled keep-alive connections shared by all worker threads
+        self.session = session if session is not None else get_session()
+
+        # Cache of event lookups, used to skip calls and as a fallback when the quota runs out
+        self.cache = cache if cache is not None else ResponseCache(ttl=TICKETMASTER_CACHE_TTL)
+        # Artist name -> attraction ID, refreshed rarely
+        self.attraction_cache = attraction_cache if attraction_cache is not None else ResponseCache(
+            filename='ticketmaster_attractions.db', ttl=ATTRACTION_CACHE_TTL
+        )
 
-        # Track API calls for daily quota
-        self.api_calls_made_today = 0
-        self.daily_quota_reset_time = time.time() + 86400  # Reset quota in 24 hours
+        # Shared limiter for every thread issuing requests
+        self.rate_limiter = TokenBucket(REQUEST_LIMIT_PER_SECOND)
+        self.max_workers = max_workers
 
-    def get_concerts(self, artist_name):
+        # Track API calls for daily quota, persisted across restarts and shared by worker processes
+        self.quota = quota if quota is not None else QuotaLedger(DAILY_API_QUOTA)
+        # Calls made by this process alone
+        self.requests_made = 0
+        self.requests_lock = threading.Lock()
+        metrics.TICKETMASTER_QUOTA_USED.set_function(self.quota.calls_made)
+        metrics.TICKETMASTER_QUOTA_LIMIT.set(DAILY_API_QUOTA)
+
+    def resolve_attraction_id(self, artist_name):
         """
-        Fetches concerts for the given artist, ensuring that rate limits and daily quota are respected.
+        Returns the Ticketmaster attraction ID whose name matches the artist exactly, or None.
         """
-        # First, check if we've reached the daily API quota
-        if self._check_daily_quota():
-            self.logger.warning(f"Daily API quota of {DAILY_API_QUOTA} reached.")
-            raise DailyQuotaReachedException()
-
-        # Prepare request parameters
         params = {
-            "apikey": self.api_key,
             "keyword": artist_name,
+            "classificationName": "music",
         }
 
-        # Check and enforce rate limit before making the request
-        self._check_rate_limit()
+        def fetch():
+            response = self._request("attractions", params)
+            attractions = (response or {}).get('_embedded', {}).get('attractions', [])
+            wanted = artist_name.strip().lower()
+            matches = [a for a in attractions if a.get('name', '').strip().lower() == wanted]
+            if not matches:
+                return {'id': None}
+            # Prefer the attraction with the most upcoming events when names collide
+            best = max(matches, key=lambda a: a.get('upcomingEvents', {}).get('_total', 0))
+            return {'id': best['id']}
 
-        try:
-            response = self._make_api_call("events", params)
-            if response:
-                events = response.get('_embedded', {}).get('events', [])
-                return events
+        resolved = self._cached(self.attraction_cache, "attractions", params, fetch, artist_name)
+        return resolved['id']
+
+    def get_concerts_for_attractions(self, attraction_ids, region=None):
+        """
+        Fetches upcoming music events for up to ATTRACTIONS_PER_REQUEST attractions at once, as Event records.
+        A region, as (name, value) pairs such as latlong/radius/unit or countryCode, limits the events
+        to that area on Ticketmaster's side.
+        Fresh cached results are returned without an API call; stale ones are served when a refresh fails.
+        """
+        attraction_ids = sorted(attraction_ids)
+        params = {
+            "attractionId": ",".join(attraction_ids),
+            "classificationName": "music",
+            "size": EVENTS_PAGE_SIZE,
+        }
+        params.update(region or ())
+
+        def fetch():
+            try:
+                # A single attraction cannot be split further, so it keeps the events the API pages through
+                truncate = len(attraction_ids) == 1
+                return [event.to_cache() for event in self._iter_events(params, truncate)]
+            except EventsDepthExceeded:
+                # More events than the API pages through: query each half of the batch on its own
+                middle = len(attraction_ids) // 2
+                halves = (attraction_ids[:middle], attraction_ids[middle:])
+                # Events billing attractions from both halves come back twice
+                events = {
+                    event.id: event for half in halves for event in self.get_concerts_for_attractions(half, region)
+                }
+                return [event.to_cache() for event in events.values()]
+
+        cached = self._cached(self.cache, "events", params, fetch, params["attractionId"])
+        return [Event.from_cache(values) for values in cached]
+
+    def _iter_events(self, params, truncate=False):
+        """
+        Yields every event matching the query as an Event, following pages as they are read.
+        If there are more events than the API lets us page through, raises EventsDepthExceeded,
+        or with truncate yields the first MAX_EVENTS_DEPTH of them.
+        """
+        page = 0
+        while True:
+            response = self._request("events", dict(params, page=page)) or {}
+            page_info = response.get('page', {})
+            total = page_info.get('totalElements', 0)
+            if page == 0 and total > MAX_EVENTS_DEPTH:
+                if not truncate:
+                    raise EventsDepthExceeded(f"{total} events for {params['attractionId']}")
+                self.logger.warning(f"Only the first {MAX_EVENTS_DEPTH} of {total} events for {params['attractionId']} can be read")
+            for event in response.get('_embedded', {}).get('events', []):
+                yield Event.from_json(event)
+            page += 1
+            if page >= page_info.get('totalPages', 0) or page * EVENTS_PAGE_SIZE >= MAX_EVENTS_DEPTH:
+                return
+
+    def iter_concerts(self, artist_names, regions=None):
+        """
+        Fetches concerts for many artists, yielding (artist_name, events) as results arrive.
+        Artists are resolved to attraction IDs, and IDs are queried in batches concurrently,
+        so one call covers many artists and only that artist's own events are returned.
+        regions optionally maps artist names to the region to search (see
+        get_concerts_for_attractions); artists sharing a region share batches.
+        """
+        regions = regions or {}
+        names_by_id = {}
+        for artist_name, attraction_id in self._map_concurrently(self.resolve_attraction_id, artist_names):
+            if attraction_id:
+                names_by_id.setdefault(attraction_id, []).append(artist_name)
             else:
-                return []
+                self.logger.debug(f"No Ticketmaster attraction found for artist {artist_name}")
+                yield artist_name, []
+
+        # Names resolving to one attraction but different regions are searched everywhere
+        ids_by_region = {}
+        for attraction_id, names in names_by_id.items():
+            attraction_regions = {regions.get(name) for name in names}
+            region = attraction_regions.pop() if len(attraction_regions) == 1 else None
+            ids_by_region.setdefault(region, []).append(attraction_id)
+
+        batches = []
+        for region, attraction_ids in ids_by_region.items():
+            attraction_ids.sort()
+            batches.extend(
+                (tuple(attraction_ids[i:i + ATTRACTIONS_PER_REQUEST]), region)
+                for i in range(0, len(attraction_ids), ATTRACTIONS_PER_REQUEST)
+            )
+        fetched = self._map_concurrently(lambda batch: self.get_concerts_for_attractions(*batch), batches)
+        for (batch, region), events in fetched:
+            events_by_id = {attraction_id: [] for attraction_id in batch}
+            for event in events:
+                for attraction_id in event.attraction_ids:
+                    if attraction_id in events_by_id:
+                        events_by_id[attraction_id].append(event)
+            for attraction_id, attraction_events in events_by_id.items():
+                for artist_name in names_by_id[attraction_id]:
+                    yield artist_name, attraction_events
+
+    def _map_concurrently(self, fn, items):
+        """
+        Runs fn over items on the thread pool, yielding (item, result) as each call completes.
+        Items that could not be fetched because the daily quota ran out are skipped.
+        """
+        skipped = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(fn, item): item for item in items}
+            try:
+                for future in as_completed(futures):
+                    item = futures[future]
+                    try:
+                        result = future.result()
+                    except DailyQuotaReachedException:
+                        skipped += 1
+                        continue
+                    except Exception as e:
+                        self.logger.error(f"Error fetching {item} from Ticketmaster: {e}")
+                        continue
+                    yield item, result
+            finally:
+                # Stop queued lookups if the consumer stops early
+                for future in futures:
+                    future.cancel()
+
+        if skipped:
+            self.logger.warning(f"Daily API quota reached: skipped {skipped} lookups without cached results")
+
+    def _cached(self, cache, endpoint, params, fetch, description):
+        """
+        Returns the cached value for the query if fresh, otherwise calls fetch() and caches its result.
+        Stale cached values are served when the quota is exhausted or the request fails; without one
+        the error is raised, so a failed lookup is never mistaken for one that found nothing.
+        """
+        cache_key = cache.make_key(endpoint, params)
+        cached_value, is_fresh = cache.get(cache_key)
+        if is_fresh:
+            return cached_value
+
+        try:
+            value = fetch()
+        except DailyQuotaReachedException:
+            if cached_value is not None:
+                self.logger.info(f"Daily API quota reached, serving cached {endpoint} for {description}")
+                return cached_value
+            raise
         except Exception as e:
-            if e.args and str(e.args[0]).startswith('429'):
-                self.logger.error(f"Rate limit exceeded: {e}")
-                self.api_calls_made_today = DAILY_API_QUOTA  # Set to max to avoid further requests
-            else:
-                self.logger.error(f"Error fetching concerts for artist {artist_name}: {e}")
-            return []
+            if cached_value is None:
+                raise
+            self.logger.error(f"Error fetching {endpoint} for {description}, serving cached result: {e}")
+            return cached_value
+
+        cache.set(cache_key, value)
+        return value
+
+    def _request(self, endpoint, params):
+        """
+        Makes one API call after reserving it against the daily quota and waiting for the rate limiter.
+        Per-second throttling is retried with exponential backoff, honouring Retry-After.
+        """
+        for attempt in range(MAX_THROTTLE_RETRIES + 1):
+            if not self._reserve_api_call():
+                self.logger.warning(f"Daily API quota of {DAILY_API_QUOTA} reached.")
+                raise DailyQuotaReachedException()
+
+            # Check and enforce rate limit before making the request
+            self._check_rate_limit()
+            try:
+                return self._make_api_call(endpoint, dict(params, apikey=self.api_key))
+            except RateLimitedException as e:
+                if e.quota_exhausted:
+                    self.logger.error(f"Ticketmaster reports the daily quota as used up: {e}")
+                    self.quota.mark_exhausted(e.reset_at)
+                    raise DailyQuotaReachedException() from e
+                if attempt == MAX_THROTTLE_RETRIES:
+                    raise
+                delay = e.retry_after if e.retry_after is not None else THROTTLE_BACKOFF * 2 ** attempt
+                self.logger.warning(f"Throttled by Ticketmaster, backing off for {delay:.1f} seconds")
+                # Slow every worker down, not just this one
+                self.rate_limiter.pause(delay)
 
     def _make_api_call(self, endpoint, params):
         """
         Makes a synchronous API call to the Ticketmaster API.
         """
         url = f"{self.base_url}/{endpoint}.json"
-        response = requests.get(url, params=params)
-        response.raise_for_status()  # Raise an HTTPError for bad responses
+        try:
+            with metrics.API_REQUEST_DURATION.time(service='ticketmaster', endpoint=endpoint):
+                response = self.session.get(url, params=params)
+        except Exception:
+            metrics.API_REQUESTS.inc(service='ticketmaster', endpoint=endpoint, status='error')
+            raise
+        metrics.API_REQUESTS.inc(service='ticketmaster', endpoint=endpoint, status=response.status_code)
+        self._reconcile_quota(response.headers)
 
-        # Increment the daily API call counter after a successful request
-        self.api_calls_made_today += 1
+        if response.status_code == 429:
+            raise RateLimitedException(
+                f"429 Too Many Requests for {url}",
+                retry_after=self._parse_retry_after(response.headers.get('Retry-After')),
+                quota_exhausted=self._is_quota_exhausted(response),
+                reset_at=self._parse_reset(response.headers.get('Rate-Limit-Reset')),
+            )
+        response.raise_for_status()  # Raise an HTTPError for bad responses
         return response.json()
 
-    def _check_rate_limit(self):
+    def _reconcile_quota(self, headers):
         """
-        Ensures that no more than 5 requests are made per second by enforcing rate limiting.
+        Updates the quota ledger from Ticketmaster's Rate-Limit, Rate-Limit-Available and Rate-Limit-Reset headers.
         """
-        current_time = time.time()
-        if current_time - self.last_request_time >= 1:
-            # Reset the request counter and the timer after 1 second has passed
-            self.requests_made_in_second = 0
-            self.last_request_time = current_time
+        try:
+            limit = int(headers['Rate-Limit']) if 'Rate-Limit' in headers else None
+            available = int(headers['Rate-Limit-Available']) if 'Rate-Limit-Available' in headers else None
+        except ValueError:
+            return
+        reset_at = self._parse_reset(headers.get('Rate-Limit-Reset'))
+        if limit is not None or available is not None or reset_at is not None:
+            self.quota.reconcile(limit=limit, available=available, reset_at=reset_at)
 
-        if self.requests_made_in_second >= REQUEST_LIMIT_PER_SECOND:
-            # Sleep until we are allowed to make requests again
-            sleep_time = 1 - (current_time - self.last_request_time)
-            if sleep_time > 0:
-                self.logger.info(f"Rate limit reached: sleeping for {sleep_time:.2f} seconds.")
-                time.sleep(sleep_time)
+    @staticmethod
+    def _is_quota_exhausted(response):
+        if response.headers.get('Rate-Limit-Available') == '0':
+            return True
+        # Ticketmaster's gateway reports the daily quota as a quota violation, throttling as a spike arrest
+        return 'quota' in response.text.lower()
 
-            # Reset after sleeping
-            self.requests_made_in_second = 0
-            self.last_request_time = time.time()
+    @staticmethod
+    def _parse_reset(value):
+        # Rate-Limit-Reset is the end of the quota period in epoch milliseconds
+        try:
+            return int(value) / 1000 if value else None
+        except ValueError:
+            return None
 
-        # Increment the request counter
-        self.requests_made_in_second += 1
+    @staticmethod
+    def _parse_retry_after(value):
+        try:
+            return float(value) if value else None
+        except ValueError:
+            return None
 
-    def _check_daily_quota(self):
+    def _check_rate_limit(self):
         """
-        Checks if the daily API quota has been reached, and resets the quota counter if needed.
+        Blocks until the shared token bucket allows another request, keeping all threads under 5 requests per second.
         """
-        current_time = time.time()
+        self.rate_limiter.acquire()
 
-        # Check if 24 hours have passed since the last reset
-        if current_time > self.daily_quota_reset_time:
-            self.api_calls_made_today = 0
-            self.daily_quota_reset_time = current_time + 86400  # Reset quota in 24 hours
-            self.logger.info("Daily API quota reset for a new day.")
-
-        # Return True if the quota has been reached, otherwise False
-        return self.api_calls_made_today >= DAILY_API_QUOTA
+    def _reserve_api_call(self):
+        """
+        Atomically counts one call against the daily quota. Returns False if the quota has been reached.
+        """
+        if not self.quota.reserve():
+            return False
+        with self.requests_lock:
+            self.requests_made += 1
+        return True
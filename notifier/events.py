@@ -0,0 +1,63 @@
+class Event:
+    """
+    The parts of a Ticketmaster event the notifier uses, parsed once from the
+    nested Discovery API JSON. Slots keep each record small, since a run can
+    hold many thousands of them. Fields added later come last and default to
+    None, so records cached before they existed still load.
+    """
+
+    __slots__ = (
+        'id', 'name', 'attraction_ids', 'date', 'venue', 'city', 'country', 'latitude', 'longitude', 'url',
+        'country_code',
+    )
+
+    def __init__(self, id, name, attraction_ids, date, venue, city, country, latitude, longitude, url,
+                 country_code=None):
+        self.id = id
+        self.name = name
+        self.attraction_ids = tuple(attraction_ids)
+        self.date = date
+        self.venue = venue
+        self.city = city
+        self.country = country
+        self.latitude = latitude
+        self.longitude = longitude
+        self.url = url
+        self.country_code = country_code
+
+    @classmethod
+    def from_json(cls, data):
+        embedded = data.get('_embedded', {})
+        venue = (embedded.get('venues') or [{}])[0]
+        location = venue.get('location', {})
+        return cls(
+            id=data['id'],
+            name=data.get('name', ''),
+            attraction_ids=[a['id'] for a in embedded.get('attractions', []) if a.get('id')],
+            date=data.get('dates', {}).get('start', {}).get('localDate'),
+            venue=venue.get('name', ''),
+            city=venue.get('city', {}).get('name'),
+            country=venue.get('country', {}).get('name'),
+            latitude=_to_float(location.get('latitude')),
+            longitude=_to_float(location.get('longitude')),
+            url=data.get('url'),
+            country_code=venue.get('country', {}).get('countryCode'),
+        )
+
+    # Flat list form stored in the response cache
+    def to_cache(self):
+        return [getattr(self, field) for field in self.__slots__]
+
+    @classmethod
+    def from_cache(cls, values):
+        return cls(*values)
+
+    def __repr__(self):
+        return f"Event(id={self.id!r}, name={self.name!r}, date={self.date!r})"
+
+
+def _to_float(value):
+    try:
+        return float(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
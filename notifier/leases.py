@@ -0,0 +1,175 @@
+import logging
+import math
+import os
+import socket
+import sqlite3
+import threading
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PARTITIONS = 16  # Fixed number of hash partitions that workers divide between them
+LEASE_TTL = 300  # Seconds a lease or worker heartbeat stays valid without renewal
+RENEW_INTERVAL = 60  # Seconds between renewals by the background thread, well within LEASE_TTL
+
+def partition_of(key, partitions=DEFAULT_PARTITIONS):
+    """
+    Stable partition for a chat ID or artist key, the same in every process.
+    """
+    return zlib.crc32(str(key).encode()) % partitions
+
+def default_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class PartitionLeases:
+    """
+    Divides a fixed set of partitions between the worker processes sharing one
+    SQLite file. Each worker renews its leases on every refresh(); a worker that
+    stops renewing loses them after LEASE_TTL, and the others take them over.
+
+    Workers register a heartbeat, and each one holds at most its fair share of
+    partitions, so a newly started worker is handed partitions as soon as the
+    others refresh and give up their surplus. Between refreshes, which can be
+    far apart while a worker is busy, start_renewing() keeps the leases and the
+    heartbeat alive from a background thread.
+    """
+
+    def __init__(self, worker_id=None, partitions=DEFAULT_PARTITIONS, filename='partition_leases.db', lease_ttl=LEASE_TTL):
+        self.worker_id = worker_id or default_worker_id()
+        self.partitions = partitions
+        self.filename = filename
+        self.lease_ttl = lease_ttl
+        # Autocommit mode, so transactions are opened explicitly with BEGIN IMMEDIATE
+        self.conn = sqlite3.connect(self.filename, timeout=30, isolation_level=None, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS leases (partition INTEGER PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS workers (worker_id TEXT PRIMARY KEY, heartbeat REAL NOT NULL)"
+        )
+        self.owned = frozenset()
+        self._stop_renewing = threading.Event()
+        self._renew_thread = None
+
+    def refresh(self):
+        """
+        Renews this worker's leases and rebalances them towards its fair share.
+        Returns the set of partitions this worker now owns.
+        """
+        now = time.time()
+        expires_at = now + self.lease_ttl
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute(
+                    "INSERT INTO workers (worker_id, heartbeat) VALUES (?, ?) "
+                    "ON CONFLICT (worker_id) DO UPDATE SET heartbeat = excluded.heartbeat",
+                    (self.worker_id, now),
+                )
+                self.conn.execute("DELETE FROM workers WHERE heartbeat < ?", (now - self.lease_ttl,))
+                (live_workers,) = self.conn.execute("SELECT COUNT(*) FROM workers").fetchone()
+                fair_share = math.ceil(self.partitions / live_workers)
+
+                self.conn.execute(
+                    "UPDATE leases SET expires_at = ? WHERE owner = ? AND partition < ?",
+                    (expires_at, self.worker_id, self.partitions),
+                )
+                owned = [
+                    partition for (partition,) in self.conn.execute(
+                        "SELECT partition FROM leases WHERE owner = ? AND partition < ? ORDER BY partition",
+                        (self.worker_id, self.partitions),
+                    )
+                ]
+                if len(owned) > fair_share:
+                    # Hand the surplus back so newly started workers can pick it up
+                    surplus = owned[fair_share:]
+                    self.conn.executemany(
+                        "DELETE FROM leases WHERE partition = ? AND owner = ?",
+                        [(partition, self.worker_id) for partition in surplus],
+                    )
+                    owned = owned[:fair_share]
+                elif len(owned) < fair_share:
+                    taken = {
+                        partition for (partition,) in self.conn.execute(
+                            "SELECT partition FROM leases WHERE expires_at >= ?", (now,)
+                        )
+                    }
+                    free = [partition for partition in range(self.partitions) if partition not in taken]
+                    for partition in free[:fair_share - len(owned)]:
+                        self.conn.execute(
+                            "INSERT INTO leases (partition, owner, expires_at) VALUES (?, ?, ?) "
+                            "ON CONFLICT (partition) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at",
+                            (partition, self.worker_id, expires_at),
+                        )
+                        owned.append(partition)
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+            self.owned = frozenset(owned)
+        return self.owned
+
+    def renew(self):
+        """
+        Extends this worker's heartbeat and current leases without rebalancing.
+        """
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute(
+                    "INSERT INTO workers (worker_id, heartbeat) VALUES (?, ?) "
+                    "ON CONFLICT (worker_id) DO UPDATE SET heartbeat = excluded.heartbeat",
+                    (self.worker_id, now),
+                )
+                self.conn.execute(
+                    "UPDATE leases SET expires_at = ? WHERE owner = ?", (now + self.lease_ttl, self.worker_id)
+                )
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def start_renewing(self, interval=RENEW_INTERVAL):
+        """
+        Renews the leases every interval seconds on a daemon thread until release().
+        """
+        def renew_until_stopped():
+            while not self._stop_renewing.wait(interval):
+                try:
+                    self.renew()
+                except Exception as e:
+                    logger.error(f"Could not renew the leases of worker {self.worker_id}: {e}")
+
+        self._stop_renewing.clear()
+        self._renew_thread = threading.Thread(target=renew_until_stopped, name='lease-renewal', daemon=True)
+        self._renew_thread.start()
+
+    def owns(self, key):
+        """
+        Whether the chat ID or artist key falls in a partition this worker owns.
+        """
+        return partition_of(key, self.partitions) in self.owned
+
+    def release(self):
+        """
+        Gives up every lease and the heartbeat, so other workers take over without waiting for expiry.
+        """
+        self._stop_renewing.set()
+        if self._renew_thread is not None:
+            self._renew_thread.join()
+            self._renew_thread = None
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.execute("DELETE FROM leases WHERE owner = ?", (self.worker_id,))
+            self.conn.execute("DELETE FROM workers WHERE worker_id = ?", (self.worker_id,))
+            self.conn.execute("COMMIT")
+            self.owned = frozenset()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
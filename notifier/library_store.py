@@ -0,0 +1,74 @@
+import json
+import sqlite3
+import threading
+import time
+
+class LibraryStore:
+    """
+    Persists what we know about each subscriber's Spotify library between runs:
+    artist counts over their saved tracks, the newest added_at already counted,
+    and their top artists, so later runs only need to read what changed.
+    """
+
+    def __init__(self, filename='spotify_library.db'):
+        self.filename = filename
+        self.conn = sqlite3.connect(self.filename, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")  # Shared by worker processes
+        self.lock = threading.RLock()
+        self._ensure_schema()
+
+    def _ensure_schema(self):
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS libraries (
+                chat_id TEXT PRIMARY KEY,
+                artist_counts TEXT NOT NULL,
+                newest_added_at TEXT,
+                top_artists TEXT NOT NULL,
+                top_refreshed_at REAL NOT NULL,
+                full_synced_at REAL NOT NULL
+            )
+            """
+        )
+        self.conn.commit()
+
+    # Load the saved library state for a subscriber, or None if it was never synced
+    def load(self, chat_id):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT artist_counts, newest_added_at, top_artists, top_refreshed_at, full_synced_at "
+                "FROM libraries WHERE chat_id = ?",
+                (str(chat_id),),
+            ).fetchone()
+        if row is None:
+            return None
+        artist_counts, newest_added_at, top_artists, top_refreshed_at, full_synced_at = row
+        return {
+            'artist_counts': json.loads(artist_counts),
+            'newest_added_at': newest_added_at,
+            'top_artists': json.loads(top_artists),
+            'top_refreshed_at': top_refreshed_at,
+            'full_synced_at': full_synced_at,
+        }
+
+    # Save a subscriber's library state after a successful sync
+    def save(self, chat_id, state):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO libraries "
+                "(chat_id, artist_counts, newest_added_at, top_artists, top_refreshed_at, full_synced_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    str(chat_id),
+                    json.dumps(state['artist_counts']),
+                    state['newest_added_at'],
+                    json.dumps(state['top_artists']),
+                    state.get('top_refreshed_at', time.time()),
+                    state.get('full_synced_at', time.time()),
+                ),
+            )
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
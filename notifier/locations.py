@@ -0,0 +1,174 @@
+import math
+
+DEFAULT_RADIUS_KM = 100  # Radius used when a subscriber shares a location without choosing one
+MAX_RADIUS_KM = 1000  # Largest radius a subscriber can choose
+BUCKET_PRECISION = 3  # Geohash length of the index buckets, cells of about 156 x 156 km
+REGION_PRECISION = 4  # Geohash length region centers are snapped to, so nearby subscribers share queries
+REGION_RADIUS_STEP_KM = 25  # Region radii are rounded up to a multiple of this, for the same reason
+MAX_REGION_RADIUS_KM = 500  # Followers spread wider than this are queried worldwide
+EARTH_RADIUS_KM = 6371.0
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+# Geohash cells, addressed by their row (latitude) and column (longitude) in the grid of a given precision
+
+def _grid_bits(precision):
+    # Bits alternate starting with longitude, so longitude gets the odd one out
+    bits = 5 * precision
+    return bits // 2, bits - bits // 2
+
+def _cell_size(precision):
+    lat_bits, lon_bits = _grid_bits(precision)
+    return 180 / 2 ** lat_bits, 360 / 2 ** lon_bits
+
+def _cell_of(latitude, longitude, precision):
+    lat_bits, lon_bits = _grid_bits(precision)
+    row = min(int((latitude + 90) / 180 * 2 ** lat_bits), 2 ** lat_bits - 1)
+    column = min(int((longitude + 180) / 360 * 2 ** lon_bits), 2 ** lon_bits - 1)
+    return row, column
+
+def _cell_hash(row, column, precision):
+    lat_bits, lon_bits = _grid_bits(precision)
+    value = 0
+    for bit in range(5 * precision):
+        if bit % 2 == 0:
+            value = value << 1 | (column >> (lon_bits - 1 - bit // 2)) & 1
+        else:
+            value = value << 1 | (row >> (lat_bits - 1 - bit // 2)) & 1
+    return ''.join(GEOHASH_ALPHABET[(value >> shift) & 31] for shift in range(5 * (precision - 1), -1, -5))
+
+def geohash(latitude, longitude, precision):
+    return _cell_hash(*_cell_of(latitude, longitude, precision), precision)
+
+def geohash_center(latitude, longitude, precision):
+    """
+    Returns the center of the geohash cell containing the point.
+    """
+    row, column = _cell_of(latitude, longitude, precision)
+    cell_height, cell_width = _cell_size(precision)
+    return (row + 0.5) * cell_height - 90, (column + 0.5) * cell_width - 180
+
+def geohashes_within(latitude, longitude, radius_km, precision):
+    """
+    Returns the geohashes of every cell that may hold a point within radius_km of the given point.
+    """
+    lat_bits, lon_bits = _grid_bits(precision)
+    cell_height, cell_width = _cell_size(precision)
+    lat_span = math.degrees(radius_km / EARTH_RADIUS_KM)
+    south, north = max(latitude - lat_span, -90), min(latitude + lat_span, 90)
+    # Longitude degrees shrink towards the poles, so the box is widest at its pole-most latitude
+    widest = max(abs(south), abs(north))
+    if widest >= 90 or lat_span >= 90:
+        lon_span = 180
+    else:
+        lon_span = min(180, math.degrees(radius_km / (EARTH_RADIUS_KM * math.cos(math.radians(widest)))))
+
+    first_row, _ = _cell_of(south, longitude, precision)
+    last_row, _ = _cell_of(north, longitude, precision)
+    if lon_span >= 180:
+        columns = range(2 ** lon_bits)
+    else:
+        _, first_column = _cell_of(latitude, (longitude - lon_span + 180) % 360 - 180, precision)
+        count = int(2 * lon_span / cell_width) + 2
+        columns = sorted({(first_column + i) % 2 ** lon_bits for i in range(count)})
+    return {
+        _cell_hash(row, column, precision)
+        for row in range(first_row, last_row + 1)
+        for column in columns
+    }
+
+
+class SubscriberLocations:
+    """
+    Home locations of the subscribers who set one, either coordinates with a
+    radius or a country code. Subscribers with coordinates are indexed in
+    geohash buckets covering their radius, so the subscribers near an event are
+    found by looking up the event's bucket instead of measuring every distance.
+    Subscribers without a location hear about concerts anywhere.
+    """
+
+    def __init__(self, locations=()):
+        self.coordinates = {}  # chat ID -> (latitude, longitude, radius_km)
+        self.countries = {}  # chat ID -> ISO country code
+        self.buckets = {}  # geohash -> chat IDs whose radius reaches into the cell
+        for chat_id, latitude, longitude, radius_km, country_code in locations:
+            if latitude is not None and longitude is not None:
+                radius_km = radius_km or DEFAULT_RADIUS_KM
+                self.coordinates[chat_id] = (latitude, longitude, radius_km)
+                for cell in geohashes_within(latitude, longitude, radius_km, BUCKET_PRECISION):
+                    self.buckets.setdefault(cell, set()).add(chat_id)
+            elif country_code:
+                self.countries[chat_id] = country_code.upper()
+
+    def __len__(self):
+        return len(self.coordinates) + len(self.countries)
+
+    def near(self, latitude, longitude):
+        """
+        Returns the chat IDs whose radius includes the point.
+        """
+        chat_ids = set()
+        for chat_id in self.buckets.get(geohash(latitude, longitude, BUCKET_PRECISION), ()):
+            home_latitude, home_longitude, radius_km = self.coordinates[chat_id]
+            if haversine_km(latitude, longitude, home_latitude, home_longitude) <= radius_km:
+                chat_ids.add(chat_id)
+        return chat_ids
+
+    def audience(self, chat_ids, event):
+        """
+        Returns the chats among chat_ids the event is local to. Events without
+        coordinates only reach subscribers who matched on country or set no location.
+        """
+        if not self:
+            return chat_ids
+        audience = {
+            chat_id for chat_id in chat_ids if chat_id not in self.coordinates and chat_id not in self.countries
+        }
+        if event.country_code:
+            audience.update(
+                chat_id for chat_id in chat_ids if self.countries.get(chat_id) == event.country_code.upper()
+            )
+        if event.latitude is not None and event.longitude is not None and self.coordinates:
+            audience.update(self.near(event.latitude, event.longitude) & set(chat_ids))
+        return audience
+
+    def region(self, chat_ids):
+        """
+        Ticketmaster query parameters covering every chat in chat_ids, as a sorted
+        tuple of (name, value) pairs, or None when they are spread too wide to narrow
+        the query. Regions are snapped to a coarse grid so that the artists followed
+        by the same nearby subscribers share one query.
+        """
+        if not self or not chat_ids:
+            return None
+        if all(chat_id in self.countries for chat_id in chat_ids):
+            codes = {self.countries[chat_id] for chat_id in chat_ids}
+            return (('countryCode', codes.pop()),) if len(codes) == 1 else None
+        if not all(chat_id in self.coordinates for chat_id in chat_ids):
+            return None
+
+        homes = [self.coordinates[chat_id] for chat_id in chat_ids]
+        longitudes = [longitude for _, longitude, _ in homes]
+        if max(longitudes) - min(longitudes) > 180:
+            return None  # Straddles the antimeridian, where averaging longitudes breaks down
+        center_latitude = sum(latitude for latitude, _, _ in homes) / len(homes)
+        center_longitude = sum(longitudes) / len(homes)
+        snapped_latitude, snapped_longitude = geohash_center(center_latitude, center_longitude, REGION_PRECISION)
+        radius_km = max(
+            haversine_km(snapped_latitude, snapped_longitude, latitude, longitude) + home_radius_km
+            for latitude, longitude, home_radius_km in homes
+        )
+        if radius_km > MAX_REGION_RADIUS_KM:
+            return None
+        radius_km = math.ceil(radius_km / REGION_RADIUS_STEP_KM) * REGION_RADIUS_STEP_KM
+        return (
+            ('latlong', f"{snapped_latitude:.4f},{snapped_longitude:.4f}"),
+            ('radius', radius_km),
+            ('unit', 'km'),
+        )
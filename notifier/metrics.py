@@ -0,0 +1,230 @@
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+HEALTHY_RUN_AGE = 2 * 3600  # /healthz fails when no run has succeeded for this long
+
+
+class Registry:
+    """
+    Collection of metrics rendered together in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+class _Metric:
+    type = 'untyped'
+
+    def __init__(self, name, documentation, registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.values = {}
+        self.lock = threading.Lock()
+        registry.register(self)
+
+    @staticmethod
+    def _key(labels):
+        return tuple(sorted(labels.items()))
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        with self.lock:
+            return self.values.get(self._key(labels), 0)
+
+    def total(self, **labels):
+        """
+        Sums the counts of every label set that includes the given labels.
+        """
+        wanted = set(labels.items())
+        with self.lock:
+            return sum(value for key, value in self.values.items() if wanted <= set(key))
+
+    def samples(self):
+        with self.lock:
+            return [f"{self.name}{_format_labels(key)} {value}" for key, value in self.values.items()]
+
+
+class Gauge(_Metric):
+    type = 'gauge'
+
+    def __init__(self, name, documentation, registry=REGISTRY):
+        super().__init__(name, documentation, registry)
+        self.function = None
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def set_function(self, function):
+        """
+        Reads the value from function() whenever the metric is rendered.
+        """
+        self.function = function
+
+    def get(self, **labels):
+        with self.lock:
+            return self.values.get(self._key(labels))
+
+    def samples(self):
+        if self.function is not None:
+            try:
+                return [f"{self.name} {self.function()}"]
+            except Exception as e:
+                logger.debug(f"Could not read gauge {self.name}: {e}")
+                return []
+        with self.lock:
+            return [f"{self.name}{_format_labels(key)} {value}" for key, value in self.values.items()]
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        super().__init__(name, documentation, registry)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            # [per-bucket counts, sum, count]
+            state = self.values.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        lines = []
+        with self.lock:
+            for key, (counts, total, count) in self.values.items():
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_format_labels(key + (('le', bound),))} {bucket_count}")
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', '+Inf'),))} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+# API calls
+API_REQUESTS = Counter('notifier_api_requests_total', 'Outbound API requests by service, endpoint and HTTP status.')
+API_REQUEST_DURATION = Histogram('notifier_api_request_duration_seconds', 'Outbound API request latency by service and endpoint.')
+TICKETMASTER_QUOTA_USED = Gauge('notifier_ticketmaster_quota_used', 'Ticketmaster calls counted against the current quota period.')
+TICKETMASTER_QUOTA_LIMIT = Gauge('notifier_ticketmaster_quota_limit', 'Ticketmaster calls allowed per quota period.')
+
+# Pipeline
+STAGE_DURATION = Histogram('notifier_stage_duration_seconds', 'Duration of each notifier pipeline stage.', buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600))
+LIBRARY_READS_FAILED = Counter('notifier_library_reads_failed_total', 'Subscribers whose Spotify library could not be read.')
+EVENTS_FETCHED = Counter('notifier_events_fetched_total', 'Events returned by Ticketmaster for followed artists.')
+EVENTS_MATCHED = Counter('notifier_events_matched_total', 'Event and subscriber pairs checked for notification.')
+EVENTS_OUT_OF_AREA = Counter('notifier_events_out_of_area_total', 'Event and subscriber pairs skipped because the event is outside the subscriber\'s area.')
+EVENTS_DEDUPLICATED = Counter('notifier_events_deduplicated_total', 'Event and subscriber pairs skipped because they were already notified.')
+LAST_SUCCESSFUL_RUN = Gauge('notifier_last_successful_run_timestamp_seconds', 'Unix time the last notifier run completed.')
+
+# Telegram
+MESSAGES_SENT = Counter('notifier_messages_sent_total', 'Telegram messages accepted.')
+MESSAGES_FAILED = Counter('notifier_messages_failed_total', 'Failed Telegram send attempts by reason.')
+QUEUE_DEPTH = Gauge('notifier_message_queue_depth', 'Telegram messages waiting to be sent.')
+
+# Storage
+STORAGE_DURATION = Histogram('notifier_storage_operation_duration_seconds', 'Time spent in notified-concert storage operations.', buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1))
+
+
+def record_successful_run():
+    LAST_SUCCESSFUL_RUN.set(time.time())
+
+
+def health():
+    """
+    Returns (healthy, details) based on when the last run completed.
+    """
+    last_success = LAST_SUCCESSFUL_RUN.get()
+    age = time.time() - last_success if last_success else None
+    healthy = age is not None and age < HEALTHY_RUN_AGE
+    return healthy, {'status': 'ok' if healthy else 'stale', 'last_successful_run': last_success, 'age_seconds': age}
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == '/metrics':
+            self._reply(200, REGISTRY.render(), 'text/plain; version=0.0.4')
+        elif self.path == '/healthz':
+            healthy, details = health()
+            self._reply(200 if healthy else 503, json.dumps(details), 'application/json')
+        else:
+            self._reply(404, 'Not found', 'text/plain')
+
+    def _reply(self, status, body, content_type):
+        body = body.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def start_metrics_server(port, host='0.0.0.0'):
+    """
+    Serves /metrics and /healthz from a daemon thread.
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    logger.info(f"Serving metrics on port {server.server_port}")
+    return server
@@ -1,73 +1,198 @@
 import time
+import heapq
+import itertools
 import threading
-import queue
 import logging
+from collections import deque
 from telebot import TeleBot
-from config import TELEGRAM_BOT_TOKEN
+from telebot import apihelper
+from telebot.apihelper import ApiTelegramException
+from config import TELEGRAM_BOT_TOKEN, TELEGRAM_API_URL
+from notifier.rate_limiter import TokenBucket
+from notifier import metrics
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+if TELEGRAM_API_URL:
+    apihelper.API_URL = TELEGRAM_API_URL
+
 # Constants for rate limiting
 MESSAGE_LIMIT = 30  # Telegram limit: 30 messages per second to different users
 MESSAGE_SLEEP_TIME = 1.1  # Slightly over 1 second to avoid 1 msg per second limit in a chat
 MAX_MESSAGES_PER_SECOND = 30
+SENDER_WORKERS = 4  # Messages to different chats are sent in parallel
+MAX_SEND_ATTEMPTS = 5  # Give up on a message after this many failed attempts (429s excluded)
+RETRY_BACKOFF = 2  # Seconds before retrying a failed send, doubled on each attempt
 
 class NotificationService:
-    def __init__(self):
+    def __init__(self, workers=SENDER_WORKERS):
         self.bot = TeleBot(TELEGRAM_BOT_TOKEN)
-        self.message_queue = queue.Queue()  # Thread-safe queue to store messages
         self.logger = logging.getLogger(__name__)
 
-        # Start a background worker to process the queue
-        self.worker_thread = threading.Thread(target=self._process_queue)
-        self.worker_thread.daemon = True  # Daemon thread will exit when the program exits
-        self.worker_thread.start()
+        # Global limit across all chats
+        self.rate_limiter = TokenBucket(MAX_MESSAGES_PER_SECOND)
+
+        # Pending messages per chat, plus a heap of (next allowed send time, seq, chat_id)
+        # holding each chat that has messages waiting and is not currently being sent to
+        self.chat_queues = {}
+        self.ready_chats = []
+        self.sequence = itertools.count()
+        self.pending_messages = 0
+        self.condition = threading.Condition()
+
+        # Start background workers to process the queue
+        self.worker_threads = []
+        for _ in range(workers):
+            worker_thread = threading.Thread(target=self._process_queue)
+            worker_thread.daemon = True  # Daemon thread will exit when the program exits
+            worker_thread.start()
+            self.worker_threads.append(worker_thread)
+
+        metrics.QUEUE_DEPTH.set_function(self.queue_depth)
 
-    def send_notification(self, message, chat_id):
+    def send_notification(self, message, chat_id, on_sent=None):
         """
         Adds a message to the queue for processing.
+        If given, on_sent() is called from the sender thread once Telegram has accepted the message.
         """
-        full_message = message
-        self.message_queue.put((full_message, chat_id))
+        with self.condition:
+            self._enqueue((message, 0, on_sent), chat_id, time.monotonic())
+            self.pending_messages += 1
+            self.condition.notify()
         self.logger.debug(f"Message added to queue for chat_id: {chat_id}")
 
-    def _process_queue(self):
+    def queue_depth(self):
         """
-        Worker function that processes the message queue and sends messages while respecting Telegram's limits.
+        Returns the number of messages waiting to be sent, including those being retried.
         """
-        last_message_time = time.time()
-        messages_sent_in_second = 0
+        with self.condition:
+            return self.pending_messages
 
-        while True:
-            try:
-                # Block until there is a message to process
-                message, chat_id = self.message_queue.get()
+    def wait_until_sent(self, timeout=None):
+        """
+        Blocks until every queued message has been sent or given up on.
+        Returns False if the timeout expired first.
+        """
+        with self.condition:
+            return self.condition.wait_for(lambda: self.pending_messages == 0, timeout)
+
+    def discard_pending(self):
+        """
+        Drops every message still waiting to be sent, without calling its on_sent callback,
+        and returns how many were dropped. Messages being sent right now are left to finish.
+        """
+        with self.condition:
+            discarded = 0
+            # Chats on the schedule are idle, so all of their messages can go
+            for _, _, chat_id in self.ready_chats:
+                discarded += len(self.chat_queues.pop(chat_id))
+            self.ready_chats = []
+            # Chats being sent to keep their queue until the sender puts them back
+            for chat_queue in self.chat_queues.values():
+                discarded += len(chat_queue)
+                chat_queue.clear()
+            self.pending_messages -= discarded
+            self.condition.notify_all()
+        if discarded:
+            metrics.MESSAGES_FAILED.inc(discarded, reason='dropped')
+        return discarded
+
+    def _enqueue(self, item, chat_id, ready_time):
+        # Caller must hold self.condition
+        chat_queue = self.chat_queues.get(chat_id)
+        if chat_queue is None:
+            # First message for an idle chat: schedule the chat itself
+            chat_queue = self.chat_queues[chat_id] = deque()
+            heapq.heappush(self.ready_chats, (ready_time, next(self.sequence), chat_id))
+        chat_queue.append(item)
+
+    def _next_ready_chat(self):
+        """
+        Blocks until some chat is allowed to receive its next message, then returns it with that message.
+        """
+        with self.condition:
+            while True:
+                if self.ready_chats:
+                    ready_time, _, chat_id = self.ready_chats[0]
+                    wait_time = ready_time - time.monotonic()
+                    if wait_time <= 0:
+                        heapq.heappop(self.ready_chats)
+                        return chat_id, self.chat_queues[chat_id].popleft()
+                    self.condition.wait(wait_time)
+                else:
+                    self.condition.wait()
 
-                # If more than one second has passed, reset the counter
-                current_time = time.time()
-                if current_time - last_message_time >= 1:
-                    messages_sent_in_second = 0
-                    last_message_time = current_time
+    def _reschedule(self, chat_id, ready_time, retry_item=None):
+        """
+        Puts a chat back on the schedule after a send attempt, re-queueing the failed message first if given.
+        """
+        with self.condition:
+            chat_queue = self.chat_queues[chat_id]
+            if retry_item is not None:
+                chat_queue.appendleft(retry_item)
+            else:
+                self.pending_messages -= 1
+            if chat_queue:
+                heapq.heappush(self.ready_chats, (ready_time, next(self.sequence), chat_id))
+                self.condition.notify()
+            else:
+                del self.chat_queues[chat_id]
+                self.condition.notify_all()
+
+    def _process_queue(self):
+        """
+        Worker function that sends messages while respecting Telegram's limits:
+        at most one message per second per chat and MAX_MESSAGES_PER_SECOND overall.
+        """
+        while True:
+            # Block until there is a chat whose next message may be sent
+            chat_id, (message, attempts, on_sent) = self._next_ready_chat()
+            retry_item = None
+            retry_delay = 0
 
-                # Check if we hit the per-second limit
-                if messages_sent_in_second >= MAX_MESSAGES_PER_SECOND:
-                    self.logger.info(f"Rate limit hit: sleeping for 1 second")
-                    time.sleep(1)  # Sleep to avoid hitting the rate limit
-                    messages_sent_in_second = 0
+            try:
+                self.rate_limiter.acquire()
 
                 # Send the message to the subscriber
-                self.bot.send_message(chat_id, message, parse_mode='Markdown')
+                with metrics.API_REQUEST_DURATION.time(service='telegram', endpoint='sendMessage'):
+                    self.bot.send_message(chat_id, message, parse_mode='HTML')
                 self.logger.info(f"Sent message to chat_id: {chat_id}")
+                metrics.MESSAGES_SENT.inc()
 
-                # Track the number of messages sent in this second
-                messages_sent_in_second += 1
-
-                # Make sure to sleep for a short time to respect the "1 message per second per chat" limit
-                time.sleep(MESSAGE_SLEEP_TIME)
+                if on_sent is not None:
+                    self._run_callback(on_sent, chat_id)
 
-                # Mark the message as processed
-                self.message_queue.task_done()
+            except ApiTelegramException as e:
+                if e.error_code == 429:
+                    # Flood control: wait as long as Telegram asks, without counting it as a failed attempt
+                    retry_delay = (e.result_json.get('parameters') or {}).get('retry_after', 1)
+                    self.logger.warning(f"Telegram rate limit for chat_id {chat_id}: retrying in {retry_delay} seconds")
+                    retry_item = (message, attempts, on_sent)
+                    metrics.MESSAGES_FAILED.inc(reason='rate_limited')
+                else:
+                    retry_item, retry_delay = self._retry_or_drop(e, (message, attempts, on_sent), chat_id)
 
             except Exception as e:
-                self.logger.error(f"Error while sending message: {e}")
-                time.sleep(1)  # Sleep for a second to avoid spamming retries in case of errors
+                retry_item, retry_delay = self._retry_or_drop(e, (message, attempts, on_sent), chat_id)
+
+            # Respect the "1 message per second per chat" limit before this chat's next message
+            self._reschedule(chat_id, time.monotonic() + max(MESSAGE_SLEEP_TIME, retry_delay), retry_item)
+
+    def _run_callback(self, on_sent, chat_id):
+        # A failing callback must not take the sender thread down or cause a resend
+        try:
+            on_sent()
+        except Exception as e:
+            self.logger.error(f"Error in sent callback for chat_id {chat_id}: {e}")
+
+    def _retry_or_drop(self, error, item, chat_id):
+        message, attempts, on_sent = item
+        attempts += 1
+        metrics.MESSAGES_FAILED.inc(reason='error')
+        if attempts >= MAX_SEND_ATTEMPTS:
+            self.logger.error(f"Giving up on message to chat_id {chat_id} after {attempts} attempts: {error}")
+            metrics.MESSAGES_FAILED.inc(reason='dropped')
+            return None, 0
+        retry_delay = RETRY_BACKOFF * 2 ** (attempts - 1)
+        self.logger.error(f"Error while sending message to chat_id {chat_id}, retrying in {retry_delay} seconds: {error}")
+        return (message, attempts, on_sent), retry_delay
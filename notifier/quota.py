@@ -0,0 +1,105 @@
+import sqlite3
+import threading
+import time
+
+QUOTA_WINDOW = 86400  # Assumed quota period until Ticketmaster tells us when it resets
+
+class QuotaLedger:
+    """
+    Persistent count of API calls made in the current quota period.
+
+    The count survives restarts and is shared by every process using the same
+    file: reservations run in an immediate transaction, so concurrent callers
+    cannot both take the last call. The period end and the count are reconciled
+    with the rate-limit headers the API returns.
+    """
+
+    def __init__(self, daily_quota, filename='ticketmaster_quota.db'):
+        self.daily_quota = daily_quota
+        self.filename = filename
+        # Autocommit mode, so transactions are opened explicitly with BEGIN IMMEDIATE
+        self.conn = sqlite3.connect(self.filename, timeout=30, isolation_level=None, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS quota (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                calls_made INTEGER NOT NULL,
+                quota_limit INTEGER NOT NULL,
+                reset_at REAL NOT NULL
+            )
+            """
+        )
+        self.conn.execute(
+            "INSERT OR IGNORE INTO quota (id, calls_made, quota_limit, reset_at) VALUES (1, 0, ?, ?)",
+            (daily_quota, time.time() + QUOTA_WINDOW),
+        )
+
+    def _current(self):
+        # Caller must hold the lock inside a transaction; starts a new period if the old one ended
+        calls_made, quota_limit, reset_at = self.conn.execute(
+            "SELECT calls_made, quota_limit, reset_at FROM quota WHERE id = 1"
+        ).fetchone()
+        now = time.time()
+        if now >= reset_at:
+            calls_made, reset_at = 0, now + QUOTA_WINDOW
+            self.conn.execute("UPDATE quota SET calls_made = 0, reset_at = ? WHERE id = 1", (reset_at,))
+        return calls_made, quota_limit, reset_at
+
+    def _transaction(self, fn):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn()
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+            return result
+
+    def reserve(self):
+        """
+        Counts one call against the quota. Returns False if the quota has been used up.
+        """
+        def reserve():
+            calls_made, quota_limit, _ = self._current()
+            if calls_made >= quota_limit:
+                return False
+            self.conn.execute("UPDATE quota SET calls_made = calls_made + 1 WHERE id = 1")
+            return True
+        return self._transaction(reserve)
+
+    def calls_made(self):
+        return self._transaction(lambda: self._current()[0])
+
+    def reconcile(self, limit=None, available=None, reset_at=None):
+        """
+        Aligns the ledger with the API's own view, as reported in rate-limit headers.
+        """
+        def reconcile():
+            calls_made, quota_limit, current_reset_at = self._current()
+            quota_limit = min(limit, self.daily_quota) if limit is not None else quota_limit
+            if available is not None:
+                calls_made = max(0, quota_limit - available)
+            self.conn.execute(
+                "UPDATE quota SET calls_made = ?, quota_limit = ?, reset_at = ? WHERE id = 1",
+                (calls_made, quota_limit, reset_at if reset_at is not None else current_reset_at),
+            )
+        self._transaction(reconcile)
+
+    def mark_exhausted(self, reset_at=None):
+        """
+        Records that the API reported the quota as used up, until reset_at if known.
+        """
+        def mark():
+            _, quota_limit, current_reset_at = self._current()
+            self.conn.execute(
+                "UPDATE quota SET calls_made = ?, reset_at = ? WHERE id = 1",
+                (quota_limit, reset_at if reset_at is not None else current_reset_at),
+            )
+        self._transaction(mark)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,43 @@
+import threading
+import time
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. Tokens refill continuously at `rate` per second
+    up to `capacity`; each acquire() takes one token, blocking until one is
+    available. With the default capacity of 1 requests are spaced evenly, so
+    no window of one second ever sees more than `rate` of them.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def acquire(self):
+        """
+        Blocks until a token is available, then takes it.
+        """
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+    def pause(self, seconds):
+        """
+        Holds back every caller for the given number of seconds, e.g. after the server throttled us.
+        """
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.tokens, 0) - seconds * self.rate
@@ -0,0 +1,169 @@
+import hashlib
+import math
+import sqlite3
+import threading
+import time
+
+# Polling cadence per artist
+MIN_POLL_INTERVAL = 3600  # Never poll an artist more than once an hour
+DEFAULT_POLL_INTERVAL = 24 * 3600  # Interval for an artist followed by one subscriber
+MAX_POLL_INTERVAL = 7 * 86400  # Every artist is checked at least weekly
+STALE_BACKOFF = 1.5  # Interval growth after a poll that found no changes
+STALE_BACKOFF_LIMIT = 4  # Unchanged artists back off to at most this multiple of their target
+
+# Budget
+QUOTA_SAFETY_MARGIN = 0.9  # Leave part of the quota for retries and manual runs
+MAX_BUDGET_BURST = 3600  # Seconds of unused budget that may be saved up
+
+class ArtistScheduler:
+    """
+    Decides which artists to poll next. Every artist has a next-due time kept in
+    an indexed SQLite table, which acts as a persistent priority queue: the most
+    overdue artists are polled first, so all of them keep rotating even when the
+    budget is tight.
+
+    Artists followed by more subscribers get shorter intervals, intervals halve
+    when an artist's events change and grow while they stay the same. The daily
+    request budget accrues continuously, so requests are spread evenly over the
+    day instead of arriving in one burst.
+
+    Several worker processes can share one schedule: given an owns(artist_key)
+    predicate, a scheduler only syncs and polls the artists its worker owns.
+    """
+
+    def __init__(self, filename='artist_schedule.db', daily_budget=None, artists_per_request=1, owns=None):
+        self.filename = filename
+        self.daily_budget = daily_budget
+        self.artists_per_request = artists_per_request
+        self.owns = owns
+        self.conn = sqlite3.connect(self.filename, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")  # Shared by worker processes
+        self.lock = threading.RLock()
+        self.conn.create_function('owned', 1, lambda key: self.owns is None or bool(self.owns(key)))
+        self._ensure_schema()
+
+        # Request credit, accrued at daily_budget per day
+        self.credit = 0.0
+        self.credit_updated_at = time.monotonic()
+
+    def _ensure_schema(self):
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS artist_schedule (
+                artist_key TEXT PRIMARY KEY,
+                popularity INTEGER NOT NULL,
+                poll_interval REAL NOT NULL,
+                next_due REAL NOT NULL,
+                fingerprint TEXT,
+                last_checked REAL
+            )
+            """
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_artist_schedule_next_due ON artist_schedule (next_due)"
+        )
+        self.conn.commit()
+
+    @staticmethod
+    def target_interval(popularity):
+        """
+        Polling interval for an artist followed by `popularity` subscribers.
+        """
+        interval = DEFAULT_POLL_INTERVAL / (1 + math.log2(max(popularity, 1)))
+        return min(MAX_POLL_INTERVAL, max(MIN_POLL_INTERVAL, interval))
+
+    def sync(self, artist_index):
+        """
+        Brings the schedule in line with the current artist -> chat IDs index.
+        New artists are due immediately; artists nobody follows any more are dropped.
+        """
+        now = time.time()
+        with self.lock:
+            known = {
+                key: popularity
+                for key, popularity in self.conn.execute(
+                    "SELECT artist_key, popularity FROM artist_schedule WHERE owned(artist_key)"
+                )
+            }
+            for key, chat_ids in artist_index.items():
+                if self.owns is not None and not self.owns(key):
+                    continue
+                popularity = len(chat_ids)
+                if key not in known:
+                    self.conn.execute(
+                        "INSERT INTO artist_schedule (artist_key, popularity, poll_interval, next_due) VALUES (?, ?, ?, ?)",
+                        (key, popularity, self.target_interval(popularity), now),
+                    )
+                elif known[key] != popularity:
+                    self.conn.execute(
+                        "UPDATE artist_schedule SET popularity = ? WHERE artist_key = ?", (popularity, key)
+                    )
+            gone = [(key,) for key in known if key not in artist_index]
+            self.conn.executemany("DELETE FROM artist_schedule WHERE artist_key = ?", gone)
+            self.conn.commit()
+
+    def _accrue_credit(self):
+        now = time.monotonic()
+        rate = self.daily_budget * QUOTA_SAFETY_MARGIN / 86400
+        self.credit = min(rate * MAX_BUDGET_BURST, self.credit + (now - self.credit_updated_at) * rate)
+        self.credit_updated_at = now
+
+    def next_due(self, limit=None):
+        """
+        Returns keys of the most overdue artists that the accrued budget allows polling now.
+        """
+        with self.lock:
+            if limit is None:
+                if self.daily_budget is None:
+                    limit = -1  # No budget: everything that is due
+                else:
+                    self._accrue_credit()
+                    limit = int(self.credit * self.artists_per_request)
+                    if limit <= 0:
+                        return []
+            rows = self.conn.execute(
+                "SELECT artist_key FROM artist_schedule WHERE next_due <= ? AND owned(artist_key) "
+                "ORDER BY next_due LIMIT ?",
+                (time.time(), limit),
+            ).fetchall()
+        return [key for (key,) in rows]
+
+    def spend(self, requests_made):
+        """
+        Deducts the API requests actually made from the accrued budget.
+        """
+        with self.lock:
+            self.credit -= requests_made
+
+    def record_result(self, artist_key, event_ids):
+        """
+        Reschedules an artist after it was polled, based on whether its events changed.
+        """
+        fingerprint = hashlib.sha1(",".join(sorted(event_ids)).encode()).hexdigest()
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT popularity, poll_interval, fingerprint FROM artist_schedule WHERE artist_key = ?",
+                (artist_key,),
+            ).fetchone()
+            if row is None:
+                return
+            popularity, interval, previous = row
+            target = self.target_interval(popularity)
+            if previous is None:
+                interval = target
+            elif previous != fingerprint:
+                # Something changed: look again sooner
+                interval = max(MIN_POLL_INTERVAL, min(interval, target) / 2)
+            else:
+                interval = min(MAX_POLL_INTERVAL, target * STALE_BACKOFF_LIMIT, max(target, interval * STALE_BACKOFF))
+            self.conn.execute(
+                "UPDATE artist_schedule SET poll_interval = ?, next_due = ?, fingerprint = ?, last_checked = ? "
+                "WHERE artist_key = ?",
+                (interval, now + interval, fingerprint, now, artist_key),
+            )
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
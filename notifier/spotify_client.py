@@ -1,79 +1,223 @@
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import spotipy
-from spotipy.oauth2 import SpotifyOAuth
 from spotipy import SpotifyException
-from config import SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET, SPOTIFY_REDIRECT_URI
+from notifier.token_manager import TokenManager
+from notifier.rate_limiter import TokenBucket
+from notifier.transport import get_session, CONNECT_TIMEOUT, READ_TIMEOUT
+from notifier import metrics
+from config import SPOTIFY_API_URL
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Sync cadence for the persisted library state
+TOP_ARTISTS_REFRESH_INTERVAL = 7 * 86400  # Top artists change slowly
+FULL_RESYNC_INTERVAL = 30 * 86400  # Catches tracks removed from the library
+
+# Paging and throttling
+SAVED_TRACKS_PAGE_SIZE = 50  # Largest page Spotify returns
+PAGE_FETCH_WORKERS = 4  # Saved-track pages of one library fetched at once during a full sync
+REQUESTS_PER_SECOND = 20  # Spotify's rolling 30-second limit is unpublished; this stays well under it
+MAX_THROTTLE_RETRIES = 4  # Retries of a request answered with 429
+THROTTLE_BACKOFF = 1  # Seconds to back off when a 429 has no Retry-After, doubled each retry
+
+# Spotify rate-limits the app as a whole, so every client in the process shares one limiter
+rate_limiter = TokenBucket(REQUESTS_PER_SECOND)
+
 class SpotifyClient:
-    def __init__(self, access_token, refresh_token):
+    def __init__(self, access_token, refresh_token, chat_id=None, library_store=None, token_manager=None, session=None):
         self.access_token = access_token
         self.refresh_token = refresh_token
-        self.sp = spotipy.Spotify(auth=self.access_token)
+        self.chat_id = chat_id
+        self.library_store = library_store
+        # Without a shared manager, refreshed tokens are used but not persisted
+        self.token_manager = token_manager if token_manager is not None else TokenManager()
+        # Every subscriber's client shares one pooled session
+        self.session = session if session is not None else get_session()
+        self.sp = self._build_spotify()
+        # Pages can be fetched from several threads; only one of them refreshes an expired token
+        self.refresh_lock = threading.Lock()
+
+    def _build_spotify(self):
+        sp = spotipy.Spotify(
+            auth=self.access_token,
+            requests_session=self.session,
+            requests_timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+        )
+        sp.prefix = SPOTIFY_API_URL
+        return sp
+
+    def _call(self, method_name, *args, **kwargs):
+        """
+        Calls a Spotify API method. If the access token has expired, refreshes it and
+        retries the same request, so paging resumes where it stopped instead of starting over.
+        """
+        sp = self.sp
+        try:
+            return self._throttled_call(sp, method_name, *args, **kwargs)
+        except SpotifyException as e:
+            if e.http_status != 401:
+                raise
+            with self.refresh_lock:
+                # Another thread may have refreshed the token while this request was in flight
+                if self.sp is sp and not self.refresh_access_token():
+                    raise
+            return self._throttled_call(self.sp, method_name, *args, **kwargs)
+
+    def _throttled_call(self, sp, method_name, *args, **kwargs):
+        """
+        Makes the call once the shared limiter allows it. A 429 holds back every
+        client in the process for Retry-After seconds before the call is retried.
+        """
+        for attempt in range(MAX_THROTTLE_RETRIES + 1):
+            rate_limiter.acquire()
+            try:
+                return self._timed_call(sp, method_name, *args, **kwargs)
+            except SpotifyException as e:
+                if e.http_status != 429 or attempt == MAX_THROTTLE_RETRIES:
+                    raise
+                delay = self._parse_retry_after(e.headers.get('Retry-After'))
+                if delay is None:
+                    delay = THROTTLE_BACKOFF * 2 ** attempt
+                logger.warning(f"Throttled by Spotify, backing off for {delay:.1f} seconds")
+                rate_limiter.pause(delay)
+
+    @staticmethod
+    def _parse_retry_after(value):
+        try:
+            return float(value) if value else None
+        except ValueError:
+            return None
+
+    def _timed_call(self, sp, method_name, *args, **kwargs):
+        try:
+            with metrics.API_REQUEST_DURATION.time(service='spotify', endpoint=method_name):
+                result = getattr(sp, method_name)(*args, **kwargs)
+        except SpotifyException as e:
+            metrics.API_REQUESTS.inc(service='spotify', endpoint=method_name, status=e.http_status)
+            raise
+        except Exception:
+            metrics.API_REQUESTS.inc(service='spotify', endpoint=method_name, status='error')
+            raise
+        metrics.API_REQUESTS.inc(service='spotify', endpoint=method_name, status=200)
+        return result
 
     # Fetch user's favorite artists (liked songs and top artists)
-    def get_favorite_artists(self):
+    def get_favorite_artists(self, full_resync=False):
+        """
+        Returns the user's artists ranked by how often they appear in their liked songs and top artists.
+        With a library store, only tracks saved since the last run are read; a full resync of the
+        library happens when requested explicitly, on first sync, or every FULL_RESYNC_INTERVAL.
+        """
         try:
-            artist_counts = {}
-
-            # Get liked songs
-            results = self.sp.current_user_saved_tracks(limit=50)
-            while results:
-                for item in results['items']:
-                    for artist in item['track']['artists']:
-                        name = artist['name']
-                        artist_counts[name] = artist_counts.get(name, 0) + 1
-                if results['next']:
-                    results = self.sp.next(results)
-                else:
-                    break
-
-            # Get top artists
-            results = self.sp.current_user_top_artists(limit=50)
-            for artist in results['items']:
-                name = artist['name']
-                artist_counts[name] = artist_counts.get(name, 0) + 1
+            now = time.time()
+            state = None
+            if self.library_store is not None and not full_resync:
+                state = self.library_store.load(self.chat_id)
+                if state and now - state['full_synced_at'] >= FULL_RESYNC_INTERVAL:
+                    state = None
 
-            # Sort artists by count and return them
-            sorted_artists = sorted(artist_counts.items(), key=lambda x: x[1], reverse=True)
-            favorite_artists = [artist for artist, _ in sorted_artists]
-            return favorite_artists
+            if state is None:
+                state = {
+                    'artist_counts': {},
+                    'newest_added_at': None,
+                    'top_artists': [],
+                    'top_refreshed_at': 0,
+                    'full_synced_at': now,
+                }
+            last_seen_added_at = state['newest_added_at']
 
-        # Catch expired token and handle refresh token process
+            # Get liked songs, newest first
+            results = self._call('current_user_saved_tracks', limit=SAVED_TRACKS_PAGE_SIZE)
+            if last_seen_added_at is None:
+                # A full sync reads every page, and the first one tells how many there are
+                for page in [results] + self._fetch_remaining_pages(results):
+                    self._count_saved_tracks(page['items'], state)
+            else:
+                # Otherwise stop at the first track already counted, usually on the first page
+                while results:
+                    reached_seen_tracks = self._count_saved_tracks(results['items'], state, last_seen_added_at)
+                    if results['next'] and not reached_seen_tracks:
+                        results = self._call('next', results)
+                    else:
+                        break
+
+            # Get top artists, on a slower cadence
+            if now - state['top_refreshed_at'] >= TOP_ARTISTS_REFRESH_INTERVAL:
+                results = self._call('current_user_top_artists', limit=50)
+                state['top_artists'] = [artist['name'] for artist in results['items']]
+                state['top_refreshed_at'] = now
+
+            if self.library_store is not None:
+                self.library_store.save(self.chat_id, state)
+
+            return self.rank_artists(state)
+
+        # The token could not be refreshed
         except SpotifyException as e:
             if e.http_status == 401:
-                logger.debug("Access token expired, refresh needed")
-                return self.refresh_token_and_retry()
+                logger.error(f"Spotify authorization failed for chat {self.chat_id}: {e}")
+                return None
             else:
                 raise
 
-       # Handle token refresh if access token has expired
-    def refresh_token_and_retry(self):
-        try:
-            # Use app-level credentials to refresh the token
-            spotify_oauth = SpotifyOAuth(
-                client_id=SPOTIFY_CLIENT_ID,
-                client_secret=SPOTIFY_CLIENT_SECRET,
-                redirect_uri=SPOTIFY_REDIRECT_URI,
-                scope="user-library-read user-top-read",
-            )
-
-            # Refresh the access token
-            token_info = spotify_oauth.refresh_access_token(self.refresh_token)
-
-            if token_info:
-                self.access_token = token_info['access_token']
-                # Update Spotify client with the new access token
-                self.sp = spotipy.Spotify(auth=self.access_token)
-                logger.debug("Access token refreshed successfully.")
-                # Retry the original operation (get favorite artists)
-                return self.get_favorite_artists()
-            else:
-                logger.error("Failed to refresh access token.")
-                return None
+    def _fetch_remaining_pages(self, first_page):
+        """
+        Fetches the saved-track pages after the first one concurrently, by offset, in library order.
+        """
+        limit = first_page['limit'] or SAVED_TRACKS_PAGE_SIZE
+        offsets = range(first_page['offset'] + limit, first_page['total'], limit)
+        if not offsets:
+            return []
+        with ThreadPoolExecutor(max_workers=min(PAGE_FETCH_WORKERS, len(offsets))) as executor:
+            return list(executor.map(
+                lambda offset: self._call('current_user_saved_tracks', limit=limit, offset=offset), offsets
+            ))
 
-        except Exception as e:
-            logger.error(f"Error refreshing access token: {e}")
-            return None
+    @staticmethod
+    def _count_saved_tracks(items, state, last_seen_added_at=None):
+        """
+        Adds the artists of saved tracks newer than last_seen_added_at to the state.
+        Returns True once a track that was already counted is reached.
+        """
+        artist_counts = state['artist_counts']
+        for item in items:
+            added_at = item.get('added_at')
+            if last_seen_added_at and added_at and added_at <= last_seen_added_at:
+                return True
+            if added_at and (state['newest_added_at'] is None or added_at > state['newest_added_at']):
+                state['newest_added_at'] = added_at
+            for artist in item['track']['artists']:
+                name = artist['name']
+                artist_counts[name] = artist_counts.get(name, 0) + 1
+        return False
+
+    @staticmethod
+    def rank_artists(state):
+        """
+        Returns the artists in a saved library state, most liked first.
+        """
+        ranking = dict(state['artist_counts'])
+        for name in state['top_artists']:
+            ranking[name] = ranking.get(name, 0) + 1
+
+        # Sort artists by count and return them
+        sorted_artists = sorted(ranking.items(), key=lambda x: x[1], reverse=True)
+        return [artist for artist, _ in sorted_artists]
+
+    # Handle token refresh if access token has expired
+    def refresh_access_token(self):
+        logger.debug("Access token expired, refresh needed")
+        new_tokens = self.token_manager.refresh(self.chat_id, self.refresh_token)
+        if not new_tokens:
+            return False
+
+        self.access_token = new_tokens['access_token']
+        self.refresh_token = new_tokens['refresh_token']
+        # Update Spotify client with the new access token
+        self.sp = self._build_spotify()
+        logger.debug("Access token refreshed successfully.")
+        return True
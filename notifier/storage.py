@@ -1,38 +1,190 @@
 import json
 import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date
+from notifier import metrics
+
+CLAIM_TTL = 3600  # Seconds before a worker's unconfirmed claim on a concert can be taken over
+UNDATED_RETENTION = 365 * 86400  # Seconds an entry without an event date is kept, since it cannot expire by date
 
 class Storage:
-    def __init__(self, filename='notified_concerts.json'):
+    def __init__(self, filename='notified_concerts.db', legacy_filename='notified_concerts.json'):
         self.filename = filename
-        self._ensure_file_exists()
+        self.legacy_filename = legacy_filename
+        self._batch_depth = 0
+        # Marks may come from notification sender threads, so all access goes through the lock
+        self.conn = sqlite3.connect(self.filename, timeout=30, check_same_thread=False)
+        self.lock = threading.RLock()
+        self.conn.execute("PRAGMA journal_mode=WAL")  # Shared by worker processes
+        self._ensure_schema()
+        self._migrate_legacy_file()
+
+    # Ensure the table and its (chat_id, concert_id) index exist
+    def _ensure_schema(self):
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS notified_concerts (
+                chat_id TEXT NOT NULL,
+                concert_id TEXT NOT NULL,
+                event_date TEXT,
+                notified_at REAL,
+                PRIMARY KEY (chat_id, concert_id)
+            )
+            """
+        )
+        # Stores created before entries were timestamped count their entries from the upgrade
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(notified_concerts)")}
+        if 'notified_at' not in columns:
+            try:
+                self.conn.execute("ALTER TABLE notified_concerts ADD COLUMN notified_at REAL")
+                self.conn.execute("UPDATE notified_concerts SET notified_at = ?", (time.time(),))
+            except sqlite3.OperationalError as e:
+                if 'duplicate column' not in str(e):
+                    raise  # Anything but another process adding it at the same time
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_notified_concerts_event_date ON notified_concerts (event_date)"
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_notified_concerts_undated "
+            "ON notified_concerts (notified_at) WHERE event_date IS NULL"
+        )
+        # Concerts a worker is about to send, so no other worker sends them too
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS concert_claims (
+                chat_id TEXT NOT NULL,
+                concert_id TEXT NOT NULL,
+                owner TEXT NOT NULL,
+                claimed_at REAL NOT NULL,
+                PRIMARY KEY (chat_id, concert_id)
+            )
+            """
+        )
+        self.conn.commit()
 
-    # Ensure the file exists
-    def _ensure_file_exists(self):
-        if not os.path.exists(self.filename):
-            with open(self.filename, 'w') as f:
-                json.dump({}, f)  # Empty JSON object to start
+    # Import the old notified_concerts.json file once, then rename it out of the way
+    def _migrate_legacy_file(self):
+        if not self.legacy_filename or not os.path.exists(self.legacy_filename):
+            return
+        with open(self.legacy_filename, 'r') as f:
+            notified_concerts = json.load(f)
+        # The old file kept no event dates, so imported entries expire UNDATED_RETENTION after the import
+        imported_at = time.time()
+        rows = [
+            (str(chat_id), str(concert_id), None, imported_at)
+            for chat_id, concert_ids in notified_concerts.items()
+            for concert_id in concert_ids
+        ]
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO notified_concerts (chat_id, concert_id, event_date, notified_at) VALUES (?, ?, ?, ?)",
+            rows,
+        )
+        self.conn.commit()
+        try:
+            os.replace(self.legacy_filename, self.legacy_filename + '.migrated')
+        except FileNotFoundError:
+            pass  # Another process migrated it at the same time
 
-    # Load notified concerts from file
-    def load_notified_concerts(self):
-        with open(self.filename, 'r') as f:
-            return json.load(f)
+    # Commit unless a batch is open; batches commit once when they close
+    def _commit(self):
+        if self._batch_depth == 0:
+            with metrics.STORAGE_DURATION.time(operation='commit'):
+                self.conn.commit()
 
-    # Save notified concerts to file
-    def save_notified_concerts(self, notified_concerts):
-        with open(self.filename, 'w') as f:
-            json.dump(notified_concerts, f, indent=4)
+    @contextmanager
+    def batch(self):
+        """
+        Groups all writes made inside the block into a single commit. Other
+        threads wait for the batch to finish. Writes are committed even if the
+        block raises, so notifications that were already sent stay marked.
+        """
+        with self.lock:
+            self._batch_depth += 1
+            try:
+                yield self
+            finally:
+                self._batch_depth -= 1
+                self._commit()
 
     # Check if a concert has already been notified
     def is_concert_notified(self, chat_id, concert_id):
-        notified_concerts = self.load_notified_concerts()
-        if str(chat_id) in notified_concerts:
-            return concert_id in notified_concerts[str(chat_id)]
-        return False
+        with self.lock, metrics.STORAGE_DURATION.time(operation='lookup'):
+            row = self.conn.execute(
+                "SELECT 1 FROM notified_concerts WHERE chat_id = ? AND concert_id = ?",
+                (str(chat_id), str(concert_id)),
+            ).fetchone()
+        return row is not None
 
     # Mark a concert as notified
-    def mark_concert_as_notified(self, chat_id, concert_id):
-        notified_concerts = self.load_notified_concerts()
-        if str(chat_id) not in notified_concerts:
-            notified_concerts[str(chat_id)] = []
-        notified_concerts[str(chat_id)].append(concert_id)
-        self.save_notified_concerts(notified_concerts)
+    def mark_concert_as_notified(self, chat_id, concert_id, event_date=None):
+        with self.lock:
+            with metrics.STORAGE_DURATION.time(operation='mark'):
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO notified_concerts (chat_id, concert_id, event_date, notified_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (str(chat_id), str(concert_id), event_date, time.time()),
+                )
+                self.conn.execute(
+                    "DELETE FROM concert_claims WHERE chat_id = ? AND concert_id = ?", (str(chat_id), str(concert_id))
+                )
+            self._commit()
+
+    def claim_concerts(self, chat_id, concert_ids, owner, ttl=CLAIM_TTL):
+        """
+        Claims concerts for sending to a chat on behalf of owner, atomically across processes.
+        Returns the IDs claimed: those not yet notified and not claimed by another owner within ttl.
+        Claims are cleared when the concert is marked as notified.
+        """
+        now = time.time()
+        chat_id = str(chat_id)
+        claimed = []
+        with self.lock, metrics.STORAGE_DURATION.time(operation='claim'):
+            if self.conn.in_transaction:
+                self.conn.commit()
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for concert_id in map(str, concert_ids):
+                    if self.conn.execute(
+                        "SELECT 1 FROM notified_concerts WHERE chat_id = ? AND concert_id = ?", (chat_id, concert_id)
+                    ).fetchone():
+                        continue
+                    claim = self.conn.execute(
+                        "SELECT owner, claimed_at FROM concert_claims WHERE chat_id = ? AND concert_id = ?",
+                        (chat_id, concert_id),
+                    ).fetchone()
+                    if claim and claim[0] != owner and now - claim[1] < ttl:
+                        continue
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO concert_claims (chat_id, concert_id, owner, claimed_at) VALUES (?, ?, ?, ?)",
+                        (chat_id, concert_id, owner, now),
+                    )
+                    claimed.append(concert_id)
+            except Exception:
+                self.conn.rollback()
+                raise
+            self.conn.commit()
+        return claimed
+
+    # Drop entries for events that have already taken place, and undated entries older than UNDATED_RETENTION
+    def expire_notified_concerts(self, today=None):
+        today = (today or date.today()).isoformat()
+        now = time.time()
+        with self.lock, metrics.STORAGE_DURATION.time(operation='expire'):
+            expired = self.conn.execute(
+                "DELETE FROM notified_concerts WHERE event_date IS NOT NULL AND event_date < ?",
+                (today,),
+            ).rowcount
+            expired += self.conn.execute(
+                "DELETE FROM notified_concerts WHERE event_date IS NULL AND notified_at < ?",
+                (now - UNDATED_RETENTION,),
+            ).rowcount
+            self.conn.execute("DELETE FROM concert_claims WHERE claimed_at < ?", (now - CLAIM_TTL,))
+            self._commit()
+            return expired
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
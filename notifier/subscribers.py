@@ -0,0 +1,192 @@
+import json
+import os
+import sqlite3
+import threading
+
+# A subscriber's optional home location: coordinates with a radius, or a country
+LOCATION_COLUMNS = (
+    ('latitude', 'REAL'),
+    ('longitude', 'REAL'),
+    ('radius_km', 'REAL'),
+    ('country_code', 'TEXT'),
+)
+
+class SubscriberStore:
+    """
+    Subscribers and their Spotify tokens, shared by server.py, bot.py and main.py.
+    SQLite in WAL mode lets the notifier read while the OAuth callback writes, and
+    every change is a single-row upsert committed atomically.
+
+    A subscriber can also set a home location, as coordinates with a radius or
+    as a country code, to hear only about concerts near them.
+    """
+
+    def __init__(self, filename='subscribers.db', legacy_filename='subscribers.json'):
+        self.filename = filename
+        self.legacy_filename = legacy_filename
+        self.conn = sqlite3.connect(self.filename, timeout=30, check_same_thread=False)
+        self.lock = threading.RLock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self._ensure_schema()
+        self._migrate_legacy_file()
+
+    def _ensure_schema(self):
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS subscribers (
+                chat_id TEXT PRIMARY KEY,
+                access_token TEXT NOT NULL,
+                refresh_token TEXT NOT NULL,
+                expires_at INTEGER
+            )
+            """
+        )
+        # Home location columns, added to stores created before subscribers could set one
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(subscribers)")}
+        for column, column_type in LOCATION_COLUMNS:
+            if column not in columns:
+                try:
+                    self.conn.execute(f"ALTER TABLE subscribers ADD COLUMN {column} {column_type}")
+                except sqlite3.OperationalError as e:
+                    if 'duplicate column' not in str(e):
+                        raise  # Anything but another process adding it at the same time
+        self.conn.commit()
+
+    # Import the old subscribers.json file once, then rename it out of the way
+    def _migrate_legacy_file(self):
+        if not self.legacy_filename or not os.path.exists(self.legacy_filename):
+            return
+        with open(self.legacy_filename, 'r') as f:
+            subscribers = json.load(f)
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO subscribers (chat_id, access_token, refresh_token, expires_at) "
+                "VALUES (?, ?, ?, ?)",
+                [
+                    (str(chat_id), tokens['access_token'], tokens['refresh_token'], tokens.get('expires_at'))
+                    for chat_id, tokens in subscribers.items()
+                ],
+            )
+            self.conn.commit()
+        try:
+            os.replace(self.legacy_filename, self.legacy_filename + '.migrated')
+        except FileNotFoundError:
+            pass  # Another process migrated it at the same time
+
+    # Add a subscriber or replace their tokens
+    def upsert(self, chat_id, access_token, refresh_token, expires_at=None):
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO subscribers (chat_id, access_token, refresh_token, expires_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (chat_id) DO UPDATE SET access_token = excluded.access_token, "
+                "refresh_token = excluded.refresh_token, expires_at = excluded.expires_at",
+                (str(chat_id), access_token, refresh_token, expires_at),
+            )
+            self.conn.commit()
+
+    # Store refreshed tokens for an existing subscriber
+    def update_tokens(self, chat_id, tokens):
+        with self.lock:
+            self.conn.execute(
+                "UPDATE subscribers SET access_token = ?, refresh_token = ?, expires_at = ? WHERE chat_id = ?",
+                (tokens['access_token'], tokens['refresh_token'], tokens.get('expires_at'), str(chat_id)),
+            )
+            self.conn.commit()
+
+    def get(self, chat_id):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT access_token, refresh_token, expires_at FROM subscribers WHERE chat_id = ?",
+                (str(chat_id),),
+            ).fetchone()
+        if row is None:
+            return None
+        return self._tokens(row)
+
+    def set_location(self, chat_id, latitude, longitude, radius_km):
+        """
+        Sets a subscriber's home coordinates and radius, replacing any country.
+        Returns False if the chat is not subscribed.
+        """
+        return self._update_location(chat_id, latitude, longitude, radius_km, None)
+
+    def set_country(self, chat_id, country_code):
+        """
+        Limits a subscriber to concerts in one country, replacing any coordinates.
+        Returns False if the chat is not subscribed.
+        """
+        return self._update_location(chat_id, None, None, None, country_code.upper())
+
+    def set_radius(self, chat_id, radius_km):
+        """
+        Changes the radius around a subscriber's home coordinates.
+        Returns False if the subscriber has not set coordinates.
+        """
+        with self.lock:
+            cursor = self.conn.execute(
+                "UPDATE subscribers SET radius_km = ? WHERE chat_id = ? AND latitude IS NOT NULL",
+                (radius_km, str(chat_id)),
+            )
+            self.conn.commit()
+        return cursor.rowcount > 0
+
+    def clear_location(self, chat_id):
+        return self._update_location(chat_id, None, None, None, None)
+
+    def _update_location(self, chat_id, latitude, longitude, radius_km, country_code):
+        with self.lock:
+            cursor = self.conn.execute(
+                "UPDATE subscribers SET latitude = ?, longitude = ?, radius_km = ?, country_code = ? WHERE chat_id = ?",
+                (latitude, longitude, radius_km, country_code, str(chat_id)),
+            )
+            self.conn.commit()
+        return cursor.rowcount > 0
+
+    def get_location(self, chat_id):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT latitude, longitude, radius_km, country_code FROM subscribers WHERE chat_id = ?",
+                (str(chat_id),),
+            ).fetchone()
+        if row is None or (row[0] is None and row[3] is None):
+            return None
+        latitude, longitude, radius_km, country_code = row
+        return {'latitude': latitude, 'longitude': longitude, 'radius_km': radius_km, 'country_code': country_code}
+
+    def locations(self):
+        """
+        Returns (chat_id, latitude, longitude, radius_km, country_code) for every subscriber who set a location.
+        """
+        with self.lock:
+            return self.conn.execute(
+                "SELECT chat_id, latitude, longitude, radius_km, country_code FROM subscribers "
+                "WHERE latitude IS NOT NULL OR country_code IS NOT NULL"
+            ).fetchall()
+
+    def iter_subscribers(self, batch_size=500):
+        """
+        Yields (chat_id, tokens) in chat ID order, reading batch_size rows at a time,
+        so the whole subscriber set is never held in memory.
+        """
+        last_chat_id = ''
+        while True:
+            with self.lock:
+                rows = self.conn.execute(
+                    "SELECT chat_id, access_token, refresh_token, expires_at FROM subscribers "
+                    "WHERE chat_id > ? ORDER BY chat_id LIMIT ?",
+                    (last_chat_id, batch_size),
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield row[0], self._tokens(row[1:])
+            last_chat_id = rows[-1][0]
+
+    @staticmethod
+    def _tokens(row):
+        access_token, refresh_token, expires_at = row
+        return {'access_token': access_token, 'refresh_token': refresh_token, 'expires_at': expires_at}
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
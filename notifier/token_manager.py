@@ -0,0 +1,84 @@
+import logging
+import time
+from config import SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET, SPOTIFY_REDIRECT_URI
+
+logger = logging.getLogger(__name__)
+
+TOKEN_REFRESH_MARGIN = 600  # Refresh tokens this many seconds before they expire
+
+class TokenManager:
+    """
+    Keeps subscribers' Spotify access tokens fresh. Tokens are refreshed ahead of
+    expiry and written back to the subscriber store so the next run can reuse them.
+    """
+
+    def __init__(self, subscriber_store=None):
+        self.subscriber_store = subscriber_store
+        self._spotify_oauth = None
+
+    @property
+    def spotify_oauth(self):
+        # One OAuth helper for every refresh, created on first use; the memory
+        # cache handler keeps spotipy from writing a shared .cache file
+        if self._spotify_oauth is None:
+            # Imported here so runs without a token to refresh never load spotipy for it
+            from spotipy.cache_handler import MemoryCacheHandler
+            from spotipy.oauth2 import SpotifyOAuth
+            from notifier.transport import get_session, CONNECT_TIMEOUT, READ_TIMEOUT
+
+            self._spotify_oauth = SpotifyOAuth(
+                client_id=SPOTIFY_CLIENT_ID,
+                client_secret=SPOTIFY_CLIENT_SECRET,
+                redirect_uri=SPOTIFY_REDIRECT_URI,
+                scope="user-library-read user-top-read",
+                cache_handler=MemoryCacheHandler(),
+                requests_session=get_session(),
+                requests_timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+            )
+        return self._spotify_oauth
+
+    @staticmethod
+    def needs_refresh(tokens, margin=TOKEN_REFRESH_MARGIN):
+        expires_at = tokens.get('expires_at')
+        return not expires_at or expires_at - time.time() < margin
+
+    def refresh_expiring(self, owns=None):
+        """
+        Refreshes every subscriber whose token is missing an expiry or about to expire,
+        writing each refreshed token back to the store as it goes. With owns(chat_id),
+        only that worker's subscribers are refreshed, so no two workers race on a token.
+        """
+        refreshed = 0
+        for chat_id, tokens in self.subscriber_store.iter_subscribers():
+            if owns is not None and not owns(chat_id):
+                continue
+            if self.needs_refresh(tokens) and self.refresh(chat_id, tokens['refresh_token']):
+                refreshed += 1
+
+        if refreshed:
+            logger.info(f"Refreshed Spotify tokens for {refreshed} subscribers")
+        return refreshed
+
+    def refresh(self, chat_id, refresh_token):
+        """
+        Refreshes a single subscriber's token and persists it. Returns the new token fields, or None on failure.
+        """
+        new_tokens = self._refresh(chat_id, refresh_token)
+        if new_tokens and self.subscriber_store is not None:
+            self.subscriber_store.update_tokens(chat_id, new_tokens)
+        return new_tokens
+
+    def _refresh(self, chat_id, refresh_token):
+        try:
+            token_info = self.spotify_oauth.refresh_access_token(refresh_token)
+        except Exception as e:
+            logger.error(f"Error refreshing access token for chat {chat_id}: {e}")
+            return None
+        if not token_info:
+            logger.error(f"Failed to refresh access token for chat {chat_id}")
+            return None
+        return {
+            'access_token': token_info['access_token'],
+            'refresh_token': token_info.get('refresh_token', refresh_token),
+            'expires_at': token_info['expires_at'],
+        }
@@ -0,0 +1,61 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Transport settings shared by every outbound API client
+CONNECT_TIMEOUT = 5  # Seconds to establish a connection
+READ_TIMEOUT = 30  # Seconds to wait for a response
+POOL_CONNECTIONS = 10  # Hosts with a kept-alive pool
+POOL_MAXSIZE = 20  # Kept-alive connections per host, enough for the concurrent fetch workers
+MAX_RETRIES = 3  # Retries for connection errors and 5xx responses
+RETRY_BACKOFF_FACTOR = 0.5
+RETRY_STATUSES = (500, 502, 503, 504)  # 429s are left to the clients, which know how to handle them
+
+class PooledSession(requests.Session):
+    """
+    requests.Session with keep-alive pools, retries on transient failures and a
+    default timeout, so one hung socket cannot stall a whole run.
+    """
+
+    def __init__(self, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), shared=False):
+        super().__init__()
+        self.timeout = timeout
+        self.shared = shared
+        self.headers['Accept-Encoding'] = 'gzip, deflate'
+
+        retry = Retry(
+            total=MAX_RETRIES,
+            backoff_factor=RETRY_BACKOFF_FACTOR,
+            status_forcelist=RETRY_STATUSES,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, max_retries=retry)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super().request(method, url, **kwargs)
+
+    def close(self):
+        # Clients such as spotipy close their session when garbage-collected;
+        # a shared session has to keep its pools alive for everyone else
+        if not self.shared:
+            super().close()
+
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """
+    Returns the process-wide pooled session, creating it on first use.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = PooledSession(shared=True)
+        return _session
+
@@ -1,25 +1,31 @@
+import hmac
 from flask import Flask, request, redirect
 import telebot
-import os
-import json
 from spotipy.oauth2 import SpotifyOAuth
-from config import TELEGRAM_BOT_TOKEN, SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET, SPOTIFY_REDIRECT_URI
+from config import SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET, SPOTIFY_REDIRECT_URI
+from config import TELEGRAM_WEBHOOK_URL, TELEGRAM_WEBHOOK_SECRET
+from bot import bot, subscriber_store  # One bot and one subscriber store, shared with the command handlers
 
-bot = telebot.TeleBot(TELEGRAM_BOT_TOKEN)
-subscribers_file = 'subscribers.json'
 app = Flask(__name__)
 
-# Load subscribers from file
-def load_subscribers():
-    if os.path.exists(subscribers_file):
-        with open(subscribers_file, 'r') as file:
-            return json.load(file)
-    return {}
+# Receive Telegram updates in webhook mode and dispatch them to the bot's command handlers.
+# Only requests carrying the secret Telegram was given are accepted, since anyone can reach this server.
+def webhook():
+    secret = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+    # Compared as bytes: compare_digest rejects str arguments with non-ASCII characters
+    if not hmac.compare_digest(secret.encode(), TELEGRAM_WEBHOOK_SECRET.encode()):
+        return "Forbidden", 403
 
-# Save subscribers to file
-def save_subscribers(subscribers):
-    with open(subscribers_file, 'w') as file:
-        json.dump(subscribers, file, indent=4)
+    update = telebot.types.Update.de_json(request.get_data(as_text=True))
+    # Handlers run on the bot's worker threads, so Telegram gets its answer right away
+    bot.process_new_updates([update])
+    return "", 200
+
+# The route only exists in webhook mode, and webhook mode requires a secret
+if TELEGRAM_WEBHOOK_URL:
+    if not TELEGRAM_WEBHOOK_SECRET:
+        raise RuntimeError("TELEGRAM_WEBHOOK_SECRET must be set when TELEGRAM_WEBHOOK_URL is set")
+    app.add_url_rule('/webhook', view_func=webhook, methods=['POST'])
 
 # Route to handle the Spotify OAuth callback
 @app.route('/callback')
@@ -48,13 +54,8 @@ def callback():
         access_token = token_info['access_token']
         refresh_token = token_info['refresh_token']
 
-        # Load subscribers and save the tokens for the user
-        subscribers = load_subscribers()
-        subscribers[chat_id] = {
-            'access_token': access_token,
-            'refresh_token': refresh_token
-        }
-        save_subscribers(subscribers)
+        # Save the tokens for the user, touching only their row
+        subscriber_store.upsert(chat_id, access_token, refresh_token, token_info.get('expires_at'))
 
         # Notify the user via Telegram that they've successfully subscribed
         bot.send_message(chat_id, "You have successfully subscribed with your Spotify account!")
@@ -63,4 +64,6 @@ def callback():
         return "Error during token exchange", 400
 
 if __name__ == "__main__":
+    if TELEGRAM_WEBHOOK_URL:
+        bot.set_webhook(url=TELEGRAM_WEBHOOK_URL, secret_token=TELEGRAM_WEBHOOK_SECRET)
     app.run(port=8888)
@@ -0,0 +1,110 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from spotipy import SpotifyException
+
+import main
+from notifier import metrics
+from notifier.checkpoint import RunCheckpoint
+
+
+class FakeSpotifyClient:
+    """
+    Serves libraries from a dict of chat ID -> artist names, or the exception to raise.
+    """
+
+    libraries = {}
+    full_resyncs = []
+
+    def __init__(self, access_token, refresh_token, chat_id=None, **kwargs):
+        self.chat_id = chat_id
+
+    def get_favorite_artists(self, full_resync=False):
+        if full_resync:
+            self.full_resyncs.append(self.chat_id)
+        library = self.libraries[self.chat_id]
+        if isinstance(library, Exception):
+            raise library
+        return list(library)
+
+    @staticmethod
+    def rank_artists(state):
+        return list(state['artist_counts'])
+
+
+def subscribers(*chat_ids):
+    return [(chat_id, {'access_token': 'access', 'refresh_token': 'refresh'}) for chat_id in chat_ids]
+
+
+class BuildArtistIndexTest(unittest.TestCase):
+    def setUp(self):
+        # The library store is opened in the working directory
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmpdir.name)
+        patcher = mock.patch('notifier.spotify_client.SpotifyClient', FakeSpotifyClient)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        FakeSpotifyClient.full_resyncs = []
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmpdir.cleanup()
+
+    def test_indexes_every_subscriber(self):
+        FakeSpotifyClient.libraries = {'1': ['Muse', 'Blur'], '2': ['muse ', 'Pulp']}
+        artist_index, artist_names = main.build_artist_index(subscribers('1', '2'))
+        self.assertEqual(artist_index, {'muse': {'1', '2'}, 'blur': {'1'}, 'pulp': {'2'}})
+        self.assertEqual(artist_names['muse'], 'Muse')
+
+    def test_subscriber_whose_library_fails_is_skipped(self):
+        FakeSpotifyClient.libraries = {
+            '1': ['Muse'],
+            '2': SpotifyException(403, -1, 'Forbidden'),
+            '3': ['Pulp'],
+        }
+        failures_before = metrics.LIBRARY_READS_FAILED.get()
+        checkpoint = RunCheckpoint(filename='run_checkpoint.db')
+        try:
+            with self.assertLogs(main.logger, 'ERROR') as logs:
+                artist_index, _ = main.build_artist_index(subscribers('1', '2', '3'), checkpoint=checkpoint)
+            completed = checkpoint.completed_subscribers()
+        finally:
+            checkpoint.close()
+
+        self.assertEqual(artist_index, {'muse': {'1'}, 'pulp': {'3'}})
+        self.assertEqual(metrics.LIBRARY_READS_FAILED.get(), failures_before + 1)
+        self.assertIn('chat 2', logs.output[0])
+        # The failed subscriber is read again by the next run
+        self.assertEqual(completed, {'1': ['Muse'], '3': ['Pulp']})
+
+    def test_completed_subscribers_are_not_read_again(self):
+        FakeSpotifyClient.libraries = {'2': ['Pulp']}
+        checkpoint = RunCheckpoint(filename='run_checkpoint.db')
+        try:
+            checkpoint.complete_subscriber('1', ['Muse'])
+            artist_index, _ = main.build_artist_index(subscribers('1', '2'), checkpoint=checkpoint)
+        finally:
+            checkpoint.close()
+        self.assertEqual(artist_index, {'muse': {'1'}, 'pulp': {'2'}})
+
+    def test_full_resync_of_the_given_subscribers(self):
+        FakeSpotifyClient.libraries = {'1': ['Muse'], '2': ['Pulp'], '3': ['Blur']}
+        main.build_artist_index(subscribers('1', '2', '3'), full_resync=main.full_resync_filter([2, '3']))
+        self.assertEqual(sorted(FakeSpotifyClient.full_resyncs), ['2', '3'])
+
+    def test_full_resync_of_every_subscriber(self):
+        FakeSpotifyClient.libraries = {'1': ['Muse'], '2': ['Pulp']}
+        main.build_artist_index(subscribers('1', '2'), full_resync=main.full_resync_filter([]))
+        self.assertEqual(sorted(FakeSpotifyClient.full_resyncs), ['1', '2'])
+
+    def test_no_full_resync_by_default(self):
+        FakeSpotifyClient.libraries = {'1': ['Muse']}
+        main.build_artist_index(subscribers('1'), full_resync=main.full_resync_filter(None))
+        self.assertEqual(FakeSpotifyClient.full_resyncs, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import main
+from notifier.storage import Storage
+
+
+def concert(artist, concert_id, day=1, venue='Venue', city='Paris', country='France'):
+    details = {
+        'date': f"2026-05-{day:02d}",
+        'city': city,
+        'country': country,
+        'venue': venue,
+        'url': f"https://tickets.example/{concert_id}?a=1&b=2",
+    }
+    return artist, concert_id, details
+
+
+def many_concerts():
+    # Long venue names with emoji, which take two UTF-16 code units each
+    return [
+        concert(f"Artist {a}", f"{a}-{c}", day=c % 28 + 1, venue=f"🎸 Venue {c} " + '🎶' * 40)
+        for a in range(5)
+        for c in range(30)
+    ]
+
+
+class BuildDigestsTest(unittest.TestCase):
+    def test_single_message_when_everything_fits(self):
+        concerts = [concert('Muse', 'm1'), concert('Blur', 'b1')]
+        digests = main.build_digests(concerts)
+        self.assertEqual(len(digests), 1)
+        message, included = digests[0]
+        self.assertTrue(message.startswith("🎤 <b>Concert Alert!</b> 2 new concerts"))
+        self.assertCountEqual(included, concerts)
+
+    def test_messages_stay_within_the_limit(self):
+        for group_by_artist in (True, False):
+            digests = main.build_digests(many_concerts(), group_by_artist=group_by_artist)
+            self.assertGreater(len(digests), 1)
+            for message, _ in digests:
+                self.assertLessEqual(main.telegram_length(message), main.TELEGRAM_MESSAGE_LIMIT)
+
+    def test_every_concert_is_in_exactly_one_message(self):
+        concerts = many_concerts()
+        for group_by_artist in (True, False):
+            digests = main.build_digests(concerts, group_by_artist=group_by_artist)
+            included = [c[1] for _, message_concerts in digests for c in message_concerts]
+            self.assertCountEqual(included, [c[1] for c in concerts])
+            for message, message_concerts in digests:
+                for _, concert_id, _ in message_concerts:
+                    self.assertIn(f"https://tickets.example/{concert_id}?a=1&amp;b=2", message)
+
+    def test_artist_heading_repeats_after_a_split(self):
+        digests = main.build_digests(many_concerts())
+        for message, message_concerts in digests:
+            artists = {artist for artist, _, _ in message_concerts}
+            for artist in artists:
+                self.assertEqual(message.count(main.format_artist_heading(artist)), 1)
+            # The first entry after the header always names its artist
+            first_block = message.split("\n\n")[1]
+            self.assertTrue(first_block.startswith(main.format_artist_heading(message_concerts[0][0])))
+
+        # At least one artist's concerts were split across messages
+        artists_per_message = [{artist for artist, _, _ in c} for _, c in digests]
+        self.assertTrue(any(a & b for a, b in zip(artists_per_message, artists_per_message[1:])))
+
+    def test_names_are_escaped(self):
+        concerts = [
+            concert('Simon & <Garfunkel>', 's1', venue='_Under_ *the* <Bridge> & Co'),
+            concert('Simon & <Garfunkel>', 's2', city='Rock & Roll <City>'),
+        ]
+        message, _ = main.build_digests(concerts)[0]
+        self.assertIn('Simon &amp; &lt;Garfunkel&gt;', message)
+        self.assertIn('_Under_ *the* &lt;Bridge&gt; &amp; Co', message)
+        self.assertIn('Rock &amp; Roll &lt;City&gt;', message)
+        self.assertNotIn('<Garfunkel>', message)
+        self.assertNotIn('<Bridge>', message)
+
+    def test_single_concert_message_is_escaped(self):
+        _, _, details = concert('A&B', 'x', venue='<Hall>')
+        message = main.format_concert_message(details, 'A&B')
+        self.assertIn('A&amp;B', message)
+        self.assertIn('&lt;Hall&gt;', message)
+
+    def test_telegram_length_counts_utf16_code_units(self):
+        self.assertEqual(main.telegram_length('abc'), 3)
+        self.assertEqual(main.telegram_length('é'), 1)
+        self.assertEqual(main.telegram_length('🎶'), 2)
+
+
+class FakeNotificationService:
+    """
+    Accepts the messages whose index is in accepted, calling their on_sent callbacks.
+    """
+
+    def __init__(self, accepted):
+        self.accepted = accepted
+        self.messages = []
+
+    def send_notification(self, message, chat_id, on_sent=None):
+        if len(self.messages) in self.accepted and on_sent is not None:
+            on_sent()
+        self.messages.append(message)
+
+    def wait_until_sent(self, timeout=None):
+        return True
+
+
+class MarkOnAcceptTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.storage = Storage(filename=os.path.join(self.tmpdir.name, 'notified.db'), legacy_filename=None)
+
+    def tearDown(self):
+        self.storage.close()
+        self.tmpdir.cleanup()
+
+    def test_mark_concerts_as_notified(self):
+        concerts = [concert('Muse', 'm1'), concert('Muse', 'm2')]
+        main.mark_concerts_as_notified(self.storage, 42, concerts[:1])
+        self.assertTrue(self.storage.is_concert_notified(42, 'm1'))
+        self.assertFalse(self.storage.is_concert_notified(42, 'm2'))
+
+    def test_only_concerts_in_accepted_messages_are_marked(self):
+        concerts = many_concerts()
+        digests = main.build_digests(concerts)
+        service = FakeNotificationService(accepted={0})
+        with mock.patch.object(main, '_notification_service', service):
+            main.send_new_concerts({42: concerts}, self.storage)
+
+        self.assertEqual(len(service.messages), len(digests))
+        accepted = {c[1] for c in digests[0][1]}
+        for _, concert_id, _ in concerts:
+            self.assertEqual(self.storage.is_concert_notified(42, concert_id), concert_id in accepted)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from notifier import leases
+from notifier.leases import PartitionLeases, partition_of
+
+
+class PartitionLeasesRefreshTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmpdir.name, 'leases.db')
+        self.workers = []
+
+    def tearDown(self):
+        for worker in self.workers:
+            worker.close()
+        self.tmpdir.cleanup()
+
+    def start_worker(self, worker_id, partitions=16, lease_ttl=300):
+        worker = PartitionLeases(worker_id, partitions=partitions, filename=self.filename, lease_ttl=lease_ttl)
+        self.workers.append(worker)
+        return worker
+
+    def assert_partitioned(self, workers, partitions=16):
+        owned = [worker.owned for worker in workers]
+        self.assertEqual(sum(len(partitions) for partitions in owned), partitions)
+        self.assertEqual(frozenset().union(*owned), frozenset(range(partitions)))
+
+    def test_single_worker_owns_every_partition(self):
+        worker = self.start_worker('a')
+        self.assertEqual(worker.refresh(), frozenset(range(16)))
+        self.assertTrue(all(worker.owns(chat_id) for chat_id in range(100)))
+
+    def test_new_worker_is_handed_its_share_once_others_refresh(self):
+        first = self.start_worker('a')
+        first.refresh()
+        second = self.start_worker('b')
+
+        # Every partition is still leased to the first worker
+        self.assertEqual(second.refresh(), frozenset())
+        self.assertEqual(len(first.refresh()), 8)
+        self.assertEqual(len(second.refresh()), 8)
+        self.assert_partitioned([first, second])
+
+    def test_shares_are_rounded_up_so_every_partition_is_owned(self):
+        workers = [self.start_worker(worker_id) for worker_id in 'abc']
+        for _ in range(3):
+            for worker in workers:
+                worker.refresh()
+        self.assertTrue(all(len(worker.owned) <= 6 for worker in workers))
+        self.assert_partitioned(workers)
+
+    def test_partitions_of_a_silent_worker_are_taken_over_after_the_ttl(self):
+        first = self.start_worker('a')
+        second = self.start_worker('b')
+        for worker in (first, second, first, second):
+            worker.refresh()
+
+        later = time.time() + 301
+        with mock.patch.object(leases.time, 'time', return_value=later):
+            self.assertEqual(second.refresh(), frozenset(range(16)))
+
+    def test_renewed_leases_are_not_taken_over(self):
+        first = self.start_worker('a')
+        second = self.start_worker('b')
+        for worker in (first, second, first, second):
+            worker.refresh()
+
+        later = time.time() + 200
+        with mock.patch.object(leases.time, 'time', return_value=later):
+            first.renew()
+        with mock.patch.object(leases.time, 'time', return_value=later + 200):
+            self.assertEqual(len(second.refresh()), 8)
+            self.assertEqual(len(first.refresh()), 8)
+        self.assert_partitioned([first, second])
+
+    def test_released_partitions_are_taken_over_immediately(self):
+        first = self.start_worker('a')
+        second = self.start_worker('b')
+        for worker in (first, second, first, second):
+            worker.refresh()
+
+        first.release()
+        self.assertEqual(first.owned, frozenset())
+        self.assertEqual(second.refresh(), frozenset(range(16)))
+
+    def test_partition_of_is_stable(self):
+        self.assertEqual(partition_of(12345), partition_of('12345'))
+        self.assertTrue(all(0 <= partition_of(chat_id) < 16 for chat_id in range(1000)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import random
+import unittest
+from types import SimpleNamespace
+
+from notifier.locations import (
+    BUCKET_PRECISION,
+    DEFAULT_RADIUS_KM,
+    SubscriberLocations,
+    geohash,
+    geohash_center,
+    geohashes_within,
+    haversine_km,
+)
+
+
+def event(latitude=None, longitude=None, country_code=None):
+    return SimpleNamespace(latitude=latitude, longitude=longitude, country_code=country_code)
+
+
+class GeohashTest(unittest.TestCase):
+    def test_known_hashes(self):
+        self.assertEqual(geohash(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.assertEqual(geohash(-25.382708, -49.265506, 8), '6gkzwgjz')
+        self.assertEqual(geohash(42.6, -5.6, 5), 'ezs42')
+
+    def test_prefixes_match_coarser_precisions(self):
+        full = geohash(48.8566, 2.3522, 9)
+        for precision in range(1, 9):
+            self.assertEqual(geohash(48.8566, 2.3522, precision), full[:precision])
+
+    def test_edges_of_the_map(self):
+        self.assertEqual(geohash(90, 180, 3), 'zzz')
+        self.assertEqual(geohash(-90, -180, 3), '000')
+
+    def test_center_lies_in_the_same_cell(self):
+        latitude, longitude = geohash_center(52.52, 13.405, 4)
+        self.assertEqual(geohash(latitude, longitude, 4), geohash(52.52, 13.405, 4))
+
+    def test_cells_within_cover_every_nearby_point(self):
+        rng = random.Random(22)
+        for _ in range(200):
+            latitude, longitude = rng.uniform(-85, 85), rng.uniform(-180, 180)
+            radius_km = rng.choice([10, 100, 500])
+            cells = geohashes_within(latitude, longitude, radius_km, BUCKET_PRECISION)
+            for _ in range(20):
+                point_latitude = latitude + rng.uniform(-1, 1) * radius_km / 111
+                point_longitude = (longitude + rng.uniform(-10, 10) * radius_km / 111 + 180) % 360 - 180
+                if -90 <= point_latitude <= 90 and haversine_km(latitude, longitude, point_latitude, point_longitude) <= radius_km:
+                    self.assertIn(geohash(point_latitude, point_longitude, BUCKET_PRECISION), cells)
+
+
+class SubscriberLocationsNearTest(unittest.TestCase):
+    def test_near_matches_brute_force(self):
+        rng = random.Random(22)
+        homes = [
+            (chat_id, rng.uniform(-80, 80), rng.uniform(-180, 180), rng.choice([None, 25, 100, 400]), None)
+            for chat_id in range(300)
+        ]
+        locations = SubscriberLocations(homes)
+        for _ in range(300):
+            latitude, longitude = rng.uniform(-80, 80), rng.uniform(-180, 180)
+            expected = {
+                chat_id
+                for chat_id, home_latitude, home_longitude, radius_km, _ in homes
+                if haversine_km(latitude, longitude, home_latitude, home_longitude) <= (radius_km or DEFAULT_RADIUS_KM)
+            }
+            self.assertEqual(locations.near(latitude, longitude), expected)
+
+    def test_near_across_the_antimeridian(self):
+        locations = SubscriberLocations([(1, -17.7, 179.9, 100, None)])
+        self.assertEqual(locations.near(-17.7, -179.9), {1})
+        self.assertEqual(locations.near(-17.7, -177.0), set())
+
+    def test_near_ignores_country_subscribers(self):
+        locations = SubscriberLocations([(1, None, None, None, 'gb')])
+        self.assertEqual(locations.near(51.5, -0.12), set())
+
+    def test_audience(self):
+        locations = SubscriberLocations([
+            (1, 51.5074, -0.1278, 50, None),  # London
+            (2, None, None, None, 'gb'),
+            (3, 40.7128, -74.0060, 50, None),  # New York
+        ])
+        chat_ids = [1, 2, 3, 4]
+        self.assertEqual(locations.audience(chat_ids, event(51.52, -0.1, 'GB')), {1, 2, 4})
+        self.assertEqual(locations.audience(chat_ids, event(40.73, -73.99, 'US')), {3, 4})
+        self.assertEqual(locations.audience(chat_ids, event(country_code='GB')), {2, 4})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+import threading
+import time
+import unittest
+from functools import partial
+from unittest import mock
+
+from telebot.apihelper import ApiTelegramException
+
+from notifier import notification_service
+from notifier.notification_service import NotificationService
+
+MESSAGE_SLEEP_TIME = 0.2  # Shortened per-chat spacing, so the tests run quickly
+
+
+def too_many_requests(retry_after):
+    return ApiTelegramException(
+        'sendMessage',
+        None,
+        {'error_code': 429, 'description': 'Too Many Requests', 'parameters': {'retry_after': retry_after}},
+    )
+
+
+class StubBot:
+    """
+    Records every send attempt as (chat_id, message, time). handle(chat_id, message) may raise
+    to fail the attempt, or block to keep the message in flight.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.attempts = []
+        self.lock = threading.Lock()
+        self.handle = None
+
+    def send_message(self, chat_id, message, parse_mode=None):
+        with self.lock:
+            self.attempts.append((chat_id, message, time.monotonic()))
+        if self.handle is not None:
+            self.handle(chat_id, message)
+
+    def sent_to(self, chat_id):
+        with self.lock:
+            return [(message, at) for attempt_chat_id, message, at in self.attempts if attempt_chat_id == chat_id]
+
+
+class NotificationServiceTest(unittest.TestCase):
+    def setUp(self):
+        for name, value in (('MESSAGE_SLEEP_TIME', MESSAGE_SLEEP_TIME), ('RETRY_BACKOFF', 0.01)):
+            patcher = mock.patch.object(notification_service, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def start_service(self, workers=notification_service.SENDER_WORKERS):
+        with mock.patch.object(notification_service, 'TeleBot', StubBot):
+            service = NotificationService(workers=workers)
+        return service, service.bot
+
+    def test_chat_never_gets_two_messages_within_the_sleep_time(self):
+        service, bot = self.start_service()
+        for i in range(3):
+            for chat_id in (1, 2):
+                service.send_notification(f"{chat_id}-{i}", chat_id)
+        self.assertTrue(service.wait_until_sent(5))
+
+        for chat_id in (1, 2):
+            attempts = bot.sent_to(chat_id)
+            self.assertEqual([message for message, _ in attempts], [f"{chat_id}-{i}" for i in range(3)])
+            for (_, earlier), (_, later) in zip(attempts, attempts[1:]):
+                self.assertGreaterEqual(later - earlier, MESSAGE_SLEEP_TIME)
+        # Different chats are not held back by each other
+        self.assertLess(abs(bot.sent_to(1)[0][1] - bot.sent_to(2)[0][1]), MESSAGE_SLEEP_TIME)
+
+    def test_rate_limited_message_is_retried_first_after_retry_after(self):
+        service, bot = self.start_service()
+        failed = []
+
+        def handle(chat_id, message):
+            if message == 'first' and not failed:
+                failed.append(message)
+                raise too_many_requests(0.5)
+
+        bot.handle = handle
+        sent = []
+        for message in ('first', 'second', 'third'):
+            service.send_notification(message, 1, on_sent=partial(sent.append, message))
+        self.assertTrue(service.wait_until_sent(5))
+
+        attempts = bot.sent_to(1)
+        self.assertEqual([message for message, _ in attempts], ['first', 'first', 'second', 'third'])
+        self.assertGreaterEqual(attempts[1][1] - attempts[0][1], 0.5)
+        self.assertEqual(sent, ['first', 'second', 'third'])
+        self.assertEqual(service.queue_depth(), 0)
+
+    def test_message_dropped_after_max_attempts_is_not_reported_sent(self):
+        service, bot = self.start_service()
+
+        def handle(chat_id, message):
+            if message == 'broken':
+                raise ConnectionError('connection reset')
+
+        bot.handle = handle
+        sent = []
+        service.send_notification('broken', 1, on_sent=partial(sent.append, 'broken'))
+        service.send_notification('fine', 1, on_sent=partial(sent.append, 'fine'))
+        self.assertTrue(service.wait_until_sent(10))
+
+        attempts = [message for message, _ in bot.sent_to(1)]
+        self.assertEqual(attempts, ['broken'] * notification_service.MAX_SEND_ATTEMPTS + ['fine'])
+        self.assertEqual(sent, ['fine'])
+        self.assertEqual(service.queue_depth(), 0)
+
+    def test_discard_pending_while_a_message_is_in_flight(self):
+        service, bot = self.start_service(workers=1)
+        in_flight = threading.Event()
+        release = threading.Event()
+
+        def handle(chat_id, message):
+            if message == 'in flight':
+                in_flight.set()
+                release.wait(5)
+
+        bot.handle = handle
+        sent = []
+        service.send_notification('in flight', 1, on_sent=partial(sent.append, 'in flight'))
+        self.assertTrue(in_flight.wait(5))
+        for message, chat_id in (('queued behind', 1), ('also queued', 1), ('other chat', 2)):
+            service.send_notification(message, chat_id, on_sent=partial(sent.append, message))
+
+        self.assertEqual(service.discard_pending(), 3)
+        self.assertEqual(service.queue_depth(), 1)
+        self.assertFalse(service.wait_until_sent(0.05))
+
+        release.set()
+        self.assertTrue(service.wait_until_sent(5))
+        self.assertEqual(service.queue_depth(), 0)
+        self.assertEqual(sent, ['in flight'])
+
+        # The chat being sent to when its queue was cleared can still be sent to
+        service.send_notification('later', 1, on_sent=partial(sent.append, 'later'))
+        self.assertTrue(service.wait_until_sent(5))
+        self.assertEqual(sent, ['in flight', 'later'])
+        self.assertEqual([message for message, _ in bot.sent_to(2)], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
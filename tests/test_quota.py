@@ -0,0 +1,83 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from notifier import quota
+from notifier.quota import QuotaLedger
+
+
+class QuotaLedgerReserveTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmpdir.name, 'quota.db')
+        self.ledgers = []
+
+    def tearDown(self):
+        for ledger in self.ledgers:
+            ledger.close()
+        self.tmpdir.cleanup()
+
+    def open_ledger(self, daily_quota=3):
+        ledger = QuotaLedger(daily_quota, filename=self.filename)
+        self.ledgers.append(ledger)
+        return ledger
+
+    def test_reserves_up_to_the_quota(self):
+        ledger = self.open_ledger(daily_quota=3)
+        self.assertEqual([ledger.reserve() for _ in range(4)], [True, True, True, False])
+        self.assertEqual(ledger.calls_made(), 3)
+
+    def test_count_survives_reopening(self):
+        self.open_ledger(daily_quota=2).reserve()
+        ledger = self.open_ledger(daily_quota=2)
+        self.assertEqual(ledger.calls_made(), 1)
+        self.assertTrue(ledger.reserve())
+        self.assertFalse(ledger.reserve())
+
+    def test_concurrent_reservations_never_exceed_the_quota(self):
+        ledgers = [self.open_ledger(daily_quota=50) for _ in range(4)]
+        granted = []
+        granted_lock = threading.Lock()
+
+        def reserve_all(ledger):
+            for _ in range(30):
+                if ledger.reserve():
+                    with granted_lock:
+                        granted.append(ledger)
+
+        threads = [threading.Thread(target=reserve_all, args=(ledger,)) for ledger in ledgers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(granted), 50)
+        self.assertEqual(ledgers[0].calls_made(), 50)
+
+    def test_new_period_starts_once_the_old_one_ends(self):
+        ledger = self.open_ledger(daily_quota=1)
+        self.assertTrue(ledger.reserve())
+        self.assertFalse(ledger.reserve())
+
+        later = time.time() + quota.QUOTA_WINDOW + 1
+        with mock.patch.object(quota.time, 'time', return_value=later):
+            self.assertTrue(ledger.reserve())
+            self.assertFalse(ledger.reserve())
+
+    def test_reserve_respects_exhaustion_reported_by_the_api(self):
+        ledger = self.open_ledger(daily_quota=10)
+        ledger.mark_exhausted(reset_at=time.time() + 60)
+        self.assertFalse(ledger.reserve())
+
+    def test_reserve_respects_a_lower_limit_reported_by_the_api(self):
+        ledger = self.open_ledger(daily_quota=10)
+        ledger.reconcile(limit=5, available=1)
+        self.assertTrue(ledger.reserve())
+        self.assertFalse(ledger.reserve())
+
+
+if __name__ == '__main__':
+    unittest.main()
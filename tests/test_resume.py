@@ -0,0 +1,143 @@
+import os
+import tempfile
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import main
+from notifier.checkpoint import RunCheckpoint
+from notifier.events import Event
+from notifier.storage import Storage
+from notifier.subscribers import SubscriberStore
+
+LIBRARIES = {'1': ['Alpha', 'Bravo'], '2': ['Bravo', 'Charlie']}
+
+
+def event(concert_id, artist):
+    return Event(concert_id, f"{artist} live", [artist], '2099-06-01', 'Arena', 'Paris', 'France', None, None,
+                 f"https://tickets.example/{concert_id}")
+
+
+EVENTS = {
+    'Alpha': [event('a1', 'Alpha'), event('a2', 'Alpha')],
+    'Bravo': [event('b1', 'Bravo')],
+    'Charlie': [event('c1', 'Charlie')],
+}
+
+
+class FakeSpotifyClient:
+    reads = []
+
+    def __init__(self, access_token, refresh_token, chat_id=None, **kwargs):
+        self.chat_id = chat_id
+
+    def get_favorite_artists(self, full_resync=False):
+        self.reads.append(self.chat_id)
+        return list(LIBRARIES[self.chat_id])
+
+
+class FakeConcertClient:
+    """
+    Serves EVENTS in artist name order, failing once fail_after artists have been fetched.
+    """
+
+    def __init__(self, fail_after=None):
+        self.fail_after = fail_after
+        self.fetched = []
+        self.requests_made = 0
+        self.cache = SimpleNamespace(stats=lambda: {})
+
+    def resolve_attraction_id(self, artist_name):
+        return artist_name
+
+    def iter_concerts(self, artist_names, regions=None):
+        for artist in sorted(artist_names):
+            if self.fail_after is not None and len(self.fetched) >= self.fail_after:
+                raise RuntimeError("Interrupted")
+            self.fetched.append(artist)
+            yield artist, EVENTS[artist]
+
+
+class FakeNotificationService:
+    # Accepts every message at once
+    def __init__(self):
+        self.messages = []
+
+    def send_notification(self, message, chat_id, on_sent=None):
+        self.messages.append((chat_id, message))
+        if on_sent is not None:
+            on_sent()
+
+    def wait_until_sent(self, timeout=None):
+        return True
+
+    def queue_depth(self):
+        return 0
+
+
+class ResumeInterruptedRunTest(unittest.TestCase):
+    def setUp(self):
+        # Every store is opened in the working directory
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmpdir.name)
+        patcher = mock.patch('notifier.spotify_client.SpotifyClient', FakeSpotifyClient)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        FakeSpotifyClient.reads = []
+
+        subscriber_store = SubscriberStore()
+        for chat_id in LIBRARIES:
+            subscriber_store.upsert(chat_id, 'access', 'refresh', expires_at=int(time.time()) + 86400)
+        subscriber_store.close()
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmpdir.cleanup()
+
+    def run_notifier(self, concert_client):
+        notification_service = FakeNotificationService()
+        with mock.patch.object(main, '_concert_client', concert_client), \
+                mock.patch.object(main, '_notification_service', notification_service):
+            result = main.notify_all_subscribers()
+        return result, notification_service.messages
+
+    def sent_concerts(self, messages):
+        return {
+            (chat_id, concert_id)
+            for chat_id, message in messages
+            for concert_id in ('a1', 'a2', 'b1', 'c1')
+            if f"https://tickets.example/{concert_id}" in message
+        }
+
+    def test_second_run_fetches_and_sends_only_what_is_left(self):
+        # The first run reads every library, fetches Alpha, then stops before sending anything
+        with self.assertRaises(RuntimeError):
+            self.run_notifier(FakeConcertClient(fail_after=1))
+        self.assertCountEqual(FakeSpotifyClient.reads, ['1', '2'])
+
+        # One of Alpha's concerts reached chat 1 before the process stopped
+        storage = Storage()
+        storage.mark_concert_as_notified('1', 'a2', '2099-06-01')
+        storage.close()
+
+        FakeSpotifyClient.reads = []
+        concert_client = FakeConcertClient()
+        (artists, remaining), messages = self.run_notifier(concert_client)
+
+        self.assertEqual(FakeSpotifyClient.reads, [])
+        self.assertEqual(concert_client.fetched, ['Bravo', 'Charlie'])
+        self.assertEqual((artists, remaining), (3, 0))
+        self.assertEqual(
+            self.sent_concerts(messages), {('1', 'a1'), ('1', 'b1'), ('2', 'b1'), ('2', 'c1')}
+        )
+
+        # The finished run is discarded, so the next one starts over
+        checkpoint = RunCheckpoint('full')
+        self.assertFalse(checkpoint.resumed)
+        checkpoint.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import importlib
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import config
+
+WEBHOOK_SECRET = 's3cret-token'
+
+
+class WebhookTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # The bot's subscriber store is opened in the working directory when server is imported
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.cwd = os.getcwd()
+        os.chdir(cls.tmpdir.name)
+        settings = {
+            'TELEGRAM_BOT_TOKEN': '123:token',
+            'TELEGRAM_WEBHOOK_URL': 'https://example.com/webhook',
+            'TELEGRAM_WEBHOOK_SECRET': WEBHOOK_SECRET,
+        }
+        with mock.patch.multiple(config, **settings):
+            sys.modules.pop('server', None)
+            sys.modules.pop('bot', None)
+            cls.server = importlib.import_module('server')
+        cls.client = cls.server.app.test_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.subscriber_store.close()
+        sys.modules.pop('server', None)
+        sys.modules.pop('bot', None)
+        os.chdir(cls.cwd)
+        cls.tmpdir.cleanup()
+
+    def post_update(self, headers=None):
+        with mock.patch.object(self.server.bot, 'process_new_updates') as process:
+            response = self.client.post('/webhook', data='{"update_id": 1}', headers=headers or {})
+        return response.status_code, process.call_count
+
+    def test_accepts_the_configured_secret(self):
+        self.assertEqual(self.post_update({'X-Telegram-Bot-Api-Secret-Token': WEBHOOK_SECRET}), (200, 1))
+
+    def test_rejects_a_missing_or_wrong_secret(self):
+        self.assertEqual(self.post_update(), (403, 0))
+        self.assertEqual(self.post_update({'X-Telegram-Bot-Api-Secret-Token': 'wrong'}), (403, 0))
+
+    def test_rejects_a_non_ascii_secret(self):
+        headers = {'X-Telegram-Bot-Api-Secret-Token': 's3cret-tökén'.encode().decode('latin-1')}
+        self.assertEqual(self.post_update(headers), (403, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
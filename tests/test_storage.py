@@ -0,0 +1,142 @@
+import json
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+from datetime import date
+from unittest import mock
+
+from notifier import storage
+from notifier.storage import Storage
+
+
+class ClaimConcertsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmpdir.name, 'notified_concerts.db')
+        self.stores = []
+
+    def tearDown(self):
+        for store in self.stores:
+            store.close()
+        self.tmpdir.cleanup()
+
+    def open_storage(self):
+        store = Storage(filename=self.filename, legacy_filename=None)
+        self.stores.append(store)
+        return store
+
+    def test_claims_unnotified_concerts(self):
+        store = self.open_storage()
+        self.assertEqual(store.claim_concerts(1, ['a', 'b'], 'worker-1'), ['a', 'b'])
+
+    def test_skips_concerts_already_notified(self):
+        store = self.open_storage()
+        store.mark_concert_as_notified(1, 'a')
+        self.assertEqual(store.claim_concerts(1, ['a', 'b'], 'worker-1'), ['b'])
+
+    def test_other_workers_cannot_claim_the_same_concerts(self):
+        first, second = self.open_storage(), self.open_storage()
+        self.assertEqual(first.claim_concerts(1, ['a', 'b'], 'worker-1'), ['a', 'b'])
+        self.assertEqual(second.claim_concerts(1, ['a', 'b', 'c'], 'worker-2'), ['c'])
+
+    def test_claims_are_per_chat(self):
+        store = self.open_storage()
+        store.claim_concerts(1, ['a'], 'worker-1')
+        self.assertEqual(store.claim_concerts(2, ['a'], 'worker-2'), ['a'])
+
+    def test_owner_can_reclaim_its_own_concerts(self):
+        store = self.open_storage()
+        store.claim_concerts(1, ['a'], 'worker-1')
+        self.assertEqual(store.claim_concerts(1, ['a'], 'worker-1'), ['a'])
+
+    def test_expired_claims_can_be_taken_over(self):
+        first, second = self.open_storage(), self.open_storage()
+        first.claim_concerts(1, ['a'], 'worker-1', ttl=60)
+
+        later = time.time() + 61
+        with mock.patch.object(storage.time, 'time', return_value=later):
+            self.assertEqual(second.claim_concerts(1, ['a'], 'worker-2', ttl=60), ['a'])
+
+    def test_notified_concerts_cannot_be_claimed_again(self):
+        first, second = self.open_storage(), self.open_storage()
+        first.claim_concerts(1, ['a'], 'worker-1', ttl=60)
+        first.mark_concert_as_notified(1, 'a')
+
+        later = time.time() + 61
+        with mock.patch.object(storage.time, 'time', return_value=later):
+            self.assertEqual(second.claim_concerts(1, ['a'], 'worker-2', ttl=60), [])
+
+    def test_claims_inside_a_batch_commit_pending_writes_first(self):
+        first, second = self.open_storage(), self.open_storage()
+        with first.batch():
+            first.mark_concert_as_notified(1, 'a')
+            self.assertEqual(first.claim_concerts(1, ['a', 'b'], 'worker-1'), ['b'])
+        self.assertTrue(second.is_concert_notified(1, 'a'))
+
+
+class ExpireNotifiedConcertsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmpdir.name, 'notified_concerts.db')
+        self.legacy_filename = os.path.join(self.tmpdir.name, 'notified_concerts.json')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def open_storage(self):
+        store = Storage(filename=self.filename, legacy_filename=self.legacy_filename)
+        self.addCleanup(store.close)
+        return store
+
+    def test_expires_concerts_whose_date_has_passed(self):
+        store = self.open_storage()
+        store.mark_concert_as_notified(1, 'past', '2026-01-01')
+        store.mark_concert_as_notified(1, 'future', '2026-03-01')
+        self.assertEqual(store.expire_notified_concerts(today=date(2026, 2, 1)), 1)
+        self.assertFalse(store.is_concert_notified(1, 'past'))
+        self.assertTrue(store.is_concert_notified(1, 'future'))
+
+    def test_undated_concerts_expire_after_the_retention(self):
+        store = self.open_storage()
+        store.mark_concert_as_notified(1, 'undated')
+        self.assertEqual(store.expire_notified_concerts(), 0)
+
+        later = time.time() + storage.UNDATED_RETENTION + 1
+        with mock.patch.object(storage.time, 'time', return_value=later):
+            self.assertEqual(store.expire_notified_concerts(), 1)
+        self.assertFalse(store.is_concert_notified(1, 'undated'))
+
+    def test_concerts_imported_from_the_legacy_file_expire(self):
+        with open(self.legacy_filename, 'w') as f:
+            json.dump({'1': ['a', 'b'], '2': ['a']}, f)
+        store = self.open_storage()
+        self.assertTrue(store.is_concert_notified(2, 'a'))
+        self.assertTrue(os.path.exists(self.legacy_filename + '.migrated'))
+
+        later = time.time() + storage.UNDATED_RETENTION + 1
+        with mock.patch.object(storage.time, 'time', return_value=later):
+            self.assertEqual(store.expire_notified_concerts(), 3)
+
+    def test_entries_of_stores_created_before_timestamps_expire(self):
+        conn = sqlite3.connect(self.filename)
+        conn.execute(
+            "CREATE TABLE notified_concerts (chat_id TEXT NOT NULL, concert_id TEXT NOT NULL, event_date TEXT, "
+            "PRIMARY KEY (chat_id, concert_id))"
+        )
+        conn.execute("INSERT INTO notified_concerts VALUES ('1', 'old', NULL)")
+        conn.commit()
+        conn.close()
+
+        store = self.open_storage()
+        self.assertTrue(store.is_concert_notified(1, 'old'))
+        self.assertEqual(store.expire_notified_concerts(), 0)
+
+        later = time.time() + storage.UNDATED_RETENTION + 1
+        with mock.patch.object(storage.time, 'time', return_value=later):
+            self.assertEqual(store.expire_notified_concerts(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()